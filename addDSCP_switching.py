@@ -13,22 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ryu.base import app_manager
-from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
-from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet,vlan
-from ryu.lib.packet import ethernet
-VLAN_TAG_802_1Q = 0x8100
-VLAN = vlan.vlan.__name__
-ETHERNET = ethernet.ethernet.__name__
-class SimpleSwitch13(app_manager.RyuApp):
+import switchCore
+
+class SimpleSwitch13(switchCore.SwitchCore):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    # classify, decide and emit stages of the packet-in pipeline, see switchCore
+    PLUGINS = (switchCore.WireVlan, switchCore.PushPop, switchCore.DscpFlows)
+    # a DSCP remark meter per VLAN, see installMeters
+    METERS = True
 
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
         # add a VLAN map table 
         # format: {'vlanID':[(port1,dpid1),(port2,dpid2),...]}
         self.vlan_map = {10:[(2,1),(1,1),
@@ -47,27 +43,29 @@ class SimpleSwitch13(app_manager.RyuApp):
         # bandwidth allocation based on each vlan                 
         self.bw_alloc = {10:1000,20:2000}
 
-        # populate edges containing edge ports
-        self.edges=self.getEdges()
+        # VID matches ignore the low bit, odd VIDs are the remarked class
+        self.vid_mask = 0x1ffe
+        self.setup()
 
     # Handy function that lists all attributes in the given object    
     def ls(self,obj):
         print("\n".join([x for x in dir(obj) if x[0] != "_"]))
 
-    def getEdges(self):
-        edges = [(pt,id) for vlan in self.vlan_map.values() for (pt,id) in vlan]
-        return list(set(edges))
-        
-    def getVlan(self,port,dpid):
-        for vlan,list in self.vlan_map.items():
-            if (port,dpid) in list:  return vlan
-        return 1
+    def loadConfig(self, path):
+        super(SimpleSwitch13, self).loadConfig(path)
+        self.meter_map = dict(self.config.meter_map)
+        self.bw_alloc = dict(self.config.bw)
+
+    def installMeters(self, datapath, vlans):
+        # Create DSCP Remark for each VLAN that has a rate and a meter here
+        for vlan in vlans:
+            if vlan in self.bw_alloc and self.getMeterID(vlan,datapath.id): self.add_DscpRemark(datapath,vlan)
 
     def getMeterID(self,vlanID,dpid):
         try:
             return self.meter_map[(vlanID,dpid)]
         except KeyError:
-            self.logger.info("getMeterID: Cannot find %s in meter_map", str((vlanID,dpid)))
+            self.logger.debug("getMeterID: Cannot find %s in meter_map", (vlanID,dpid))
             return 0
         
 
@@ -78,154 +76,21 @@ class SimpleSwitch13(app_manager.RyuApp):
         band=[]
         self.logger.info("Installing meter %s on %s, rate is  %s", 
                                       self.getMeterID(vlan,dp.id), dp.id,self.bw_alloc[vlan] )
+        if self.metrics is not None: self.metrics.inc('meter_mod',dp.id,vlan)
+        command=self.meterCommand(dp,self.getMeterID(vlan,dp.id))
+        if self.meter_manager is not None:
+            meter_id=self.getMeterID(vlan,dp.id)
+            if meter_id: self.meter_manager.add(dp,vlan,meter_id,self.bw_alloc[vlan],command)
+            return
         band.append( parser.OFPMeterBandDscpRemark( rate=self.bw_alloc[vlan],
                                                     burst_size=burst_size,prec_level=4) )
         meter_mod=parser.OFPMeterMod(datapath=dp,
-                                     command=OF.OFPMC_ADD,
+                                     command=command,
                                      flags=OF.OFPMF_KBPS,
                                      meter_id=self.getMeterID(vlan,dp.id),bands=band)
         dp.send_msg(meter_mod)    
 
-    def getPorts(self,map,vlanID,dpid):
-        ports=[port if id==dpid else 0 for (port,id) in map[vlanID]]
-        '''=======
-        def getPORTS(self,vlanID,dpid):
-        self.logger.info("getPORTS called vlanID = %s dpid = %s",vlanID,dpid)
-        access=[x[0] if x[1]==dpid else 0 for x in self.vlan_map[vlanID]]
-        trunk=[x[0] if x[1]==dpid else 0 for x in self.trunk_map[vlanID]]
-        ports=access+trunk
-        >>>>>> parent of 51315fa... Not working yet. Gotta fix flooding on vlan trunk'''
-        while 0 in ports: ports.remove(0)
-        return ports
-
-    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
-    def switch_features_handler(self, ev):
-        #self.ls(ev.msg)
-        datapath = ev.msg.datapath
-        msg = ev.msg
-        dpid = datapath.id
-        OF = datapath.ofproto
-        parser = datapath.ofproto_parser
-        #in_port = msg.match['in_port']
-        #vlan = self.getVlan(in_port,dpid)
-
-        # install table-miss flow entry
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(OF.OFPP_CONTROLLER,OF.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
-        # Create DSCP Remark for each VLAN in the map
-        for vlan in self.vlan_map:
-            self.add_DscpRemark(datapath,vlan)
-
-    def add_flow(self, datapath, priority, match, actions, write=None,buffer_id=None,meter_id=None):
-        OF = datapath.ofproto
-        parser = datapath.ofproto_parser
-        inst=[]
-        if len(actions)>0: inst.append(parser.OFPInstructionActions(OF.OFPIT_APPLY_ACTIONS,actions))
-        if write is not None:inst.append(parser.OFPInstructionActions(OF.OFPIT_WRITE_ACTIONS,write))
-        if (meter_id is not None) and (meter_id != 0) : inst.append(parser.OFPInstructionMeter(meter_id))
-        if buffer_id:
-            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
-                        priority=priority, match=match,instructions=inst)
-        else:
-            mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match, instructions=inst)
-        print inst
-        #self.logger.info("flow_mod match: %s action: %s", str(match),str(inst))
-        datapath.send_msg(mod)
-
-    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
-    def _packet_in_handler(self, ev):
-        if ev.msg.msg_len < ev.msg.total_len:
-            self.logger.debug("packet truncated: only %s of %s bytes",ev.msg.msg_len, ev.msg.total_len)
-        msg = ev.msg
-        pkt = packet.Packet(msg.data)
-        header = dict((p.protocol_name, p) for p in pkt.protocols if type(p) != str)
-        
-        datapath = msg.datapath
-        OF,parser = datapath.ofproto,datapath.ofproto_parser
-        in_port = msg.match['in_port']
-        dpid = datapath.id
-        vlan = self.getVlan(in_port,dpid)
-        meterID = 0 if  vlan is 1 else self.getMeterID(vlan,dpid)
-        actions=[]
-        Wactions=[]
-        match = parser.OFPMatch()
-        eth = header[ETHERNET]
-        dst,src = eth.dst,eth.src
-        #Pop Vlan Tag if necessary        
-        if VLAN in header: 
-            vlan=header[VLAN].vid
-            vlan=vlan-vlan%2#get even vlans
-            #print ("Vlan in the HEADER %s src: %s dst: %s P: %s V: %s", dpid, src, dst,in_port, vlan)           
-        #self.logger.info("packet in %s src: %s dst: %s P: %s V: %s", dpid, src, dst,in_port, vlan)
-        self.mac_to_port.setdefault(dpid, {})
-        if vlan is not 1:
-            access_ports=self.getPorts(self.vlan_map,vlan,dpid)
-            trunk_ports=self.getPorts(self.trunk_map,vlan,dpid)
-
-        # learn a mac address to avoid FLOOD next time.
-        self.mac_to_port[dpid][src] = in_port
-        #self.logger.info("packet in %s src: %s dst: %s P: %s V: %s", dpid, src, dst,in_port, vlan)
-        if dst in self.mac_to_port[dpid]:
-            #self.logger.info("found %s in mac_to_port[%s][%s]",dst,vlan,dpid)
-            floodOut = False
-            out_port = self.mac_to_port[dpid][dst]           
-            #self.logger.info("packet known %s P: %s V: %s", dpid, out_port, vlan)
-            if vlan is 1:
-                Wactions.append(parser.OFPActionOutput(out_port))
-            elif out_port in trunk_ports:
-                Wactions.append(parser.OFPActionOutput(out_port))
-                self.logger.info("Pushing Vlan Tag %s, dpid:%s,src:%s,dst:%s", vlan, dpid,src, dst)
-                field=parser.OFPMatchField.make(OF.OXM_OF_VLAN_VID,vlan)
-                actions.append(parser.OFPActionPushVlan(VLAN_TAG_802_1Q))
-                actions.append(parser.OFPActionSetField(field))
-            elif out_port in access_ports:
-                Wactions.append(parser.OFPActionOutput(out_port))
-            
-        else:
-            floodOut = True
-            actions = []
-            out_port = []
-            if vlan is 1:
-                out_port = OF.OFPP_FLOOD
-                Wactions.append(parser.OFPActionOutput(out_port))
-            else:
-                out_port=list(set(access_ports+trunk_ports)-set([in_port]))
-                #self.logger.warning(str(self.getPorts(self.vlan,dpid)))
-                for x in out_port:
-                    Wactions.append(datapath.ofproto_parser.OFPActionOutput(x))
-
-        #actions = [parser.OFPActionOutput(out_port)]
-
-        # install a flow to avoid packet_in next time
-        if not floodOut:
-            if VLAN in header:
-                print ("About to POP VLAN in %s src: %s dst: %s P: %s V: %s", dpid, src, dst,in_port, vlan)
-                match = parser.OFPMatch(in_port=in_port, eth_dst=dst,vlan_vid=vlan)
-                actions.append(parser.OFPActionPopVlan())
-                meter_id=0
-                #match.set_vlan_vid_masked(vlan,((1 << 16) - 2))
-            else:
-                match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
-            #actions.append(parser.OFPActionPopVlan())
-            # verify if we have a valid buffer_id, if yes avoid to send both
-            # flow_mod & packet_out
-            if msg.buffer_id != OF.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions, write=Wactions,buffer_id=msg.buffer_id,meter_id=meterID)
-                return
-            else:
-                self.add_flow(datapath, 1, match, actions,write=Wactions)
-        #self.logger.info("packet out %s P: %s V: %s", dpid, out_port, vlan)
-        data = None
-        if msg.buffer_id == OF.OFP_NO_BUFFER:
-            data = msg.data
-        actions=actions+Wactions
-        out = parser.OFPPacketOut(datapath=datapath,in_port=in_port, buffer_id=msg.buffer_id, actions=actions, data=data)
-        datapath.send_msg(out)
-
-
-
-
-
-
+    def meterVlan(self,dpid,meter_id):
+        for (vlan,id),meter in self.meter_map.items():
+            if id==dpid and meter==meter_id: return vlan
+        return None
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+"""In-process packet-in benchmark for the switching apps.
+
+Drives SimpleSwitch13._packet_in_handler of each variant with synthetic
+EventOFPPacketIn messages from a StubDatapath that records what the app
+sends, so no Mininet or root is needed:
+
+    python benchmark.py -n 20000
+    python benchmark.py --variants edgeSwitching --scenarios flood tagged
+"""
+import argparse
+import importlib
+import os
+import random
+import struct
+import sys
+from timeit import default_timer as timer
+
+from ryu.controller import ofp_event
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+VARIANTS = ['vlanSwitching', 'newSwitching', 'edgeSwitching', 'addDSCP_switching']
+
+class StubDatapath(object):
+    """Stands in for ryu's Datapath and records every message sent."""
+
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.xid = 0
+        self.sent = []
+        self.writes = 0
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        # serialize like ryu's Datapath does, it is part of the cost
+        if msg.xid is None:
+            self.set_xid(msg)
+        msg.serialize()
+        self.sent.append(msg)
+        self.writes += 1
+        return True
+
+    def send(self, buf):
+        self.writes += 1
+        return True
+
+    def count(self, cls):
+        return sum(1 for msg in self.sent if isinstance(msg, cls))
+
+def mac(n):
+    return struct.pack('!HI', 0x0200, n)
+
+def frame(dst, src, vid=None, dscp=None):
+    """Raw Ethernet frame, 802.1Q tagged if vid, IPv4 with dscp if given."""
+    eth = dst + src
+    if vid is not None:
+        eth += struct.pack('!HH', 0x8100, vid)
+    if dscp is None:
+        return eth + struct.pack('!H', 0x0806) + b'\x00' * 28
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, dscp << 2, 20, 0, 0, 64, 17, 0, b'\x0a\x00\x00\x01', b'\x0a\x00\x00\x02')
+    return eth + struct.pack('!H', 0x0800) + ip + b'\x00' * 8
+
+def ip(n):
+    return struct.pack('!I', 0x0a000000 + n)
+
+def arpFrame(src, sip, tip, op=1, dst=b'\xff' * 6):
+    """ARP request (op 1) or reply (op 2) from src/sip for tip."""
+    return dst + src + struct.pack('!HHHBBH6s4s6s4s', 0x0806, 1, 0x0800, 6, 4, op, src, sip, b'\x00' * 6, tip)
+
+def loadApp(name):
+    module = importlib.import_module(name)
+    return module.SimpleSwitch13()
+
+def connect(app, datapath):
+    msg = datapath.ofproto_parser.OFPSwitchFeatures(datapath)
+    app.switch_features_handler(ofp_event.EventOFPSwitchFeatures(msg))
+
+def packetIn(app, datapath, in_port, data, buffer_id=None):
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    if buffer_id is None:
+        buffer_id = OF.OFP_NO_BUFFER
+    msg = parser.OFPPacketIn(datapath, buffer_id=buffer_id, total_len=len(data),
+                             reason=OF.OFPR_NO_MATCH, table_id=0, cookie=0,
+                             match=parser.OFPMatch(in_port=in_port), data=data)
+    msg.msg_len = len(data)
+    app._packet_in_handler(ofp_event.EventOFPPacketIn(msg))
+
+# Scenarios yield (dpid, in_port, data); dpid 3 is an edge switch with
+# VLAN 10 on ports 2-4, VLAN 20 on port 5 and both VLANs trunked on port 1.
+def flood(rng, n):
+    for i in range(n):
+        yield 3, 2, frame(mac(1000000 + i), mac(rng.randint(1, 1000)))
+
+def learned(rng, n):
+    yield 3, 3, frame(mac(1), mac(2))
+    for i in range(n):
+        yield 3, 2, frame(mac(2), mac(1))
+
+def tagged(rng, n):
+    yield 3, 2, frame(mac(1), mac(3))
+    for i in range(n):
+        yield 3, 1, frame(mac(3), mac(rng.randint(4, 1000)), vid=10)
+
+def metered(rng, n):
+    yield 3, 5, frame(mac(1), mac(5), dscp=0)
+    for i in range(n):
+        yield 3, 1, frame(mac(5), mac(rng.randint(6, 1000)), vid=20, dscp=rng.choice((0, 2)))
+
+def arp(rng, n):
+    # one host shows up, then others keep asking for it
+    yield 3, 3, arpFrame(mac(1), ip(1), ip(2))
+    for i in range(n):
+        k = rng.randint(2, 1000)
+        yield 3, 2, arpFrame(mac(k), ip(k), ip(1))
+
+SCENARIOS = [('flood', flood), ('learned', learned), ('tagged', tagged), ('metered', metered), ('arp', arp)]
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def run(variant, scenario, n, seed=0, metrics=False, proxy_arp=False):
+    app = loadApp(variant)
+    if metrics:
+        app.enableMetrics()
+    if proxy_arp:
+        import proxyArp
+        app.proxy_arp = proxyArp.ProxyArp()
+    datapaths = {}
+    packets = list(dict(SCENARIOS)[scenario](random.Random(seed), n))
+    samples = []
+    for dpid, in_port, data in packets:
+        if dpid not in datapaths:
+            datapaths[dpid] = StubDatapath(dpid)
+            connect(app, datapaths[dpid])
+            datapaths[dpid].sent = []
+    for dpid, in_port, data in packets:
+        start = timer()
+        packetIn(app, datapaths[dpid], in_port, data)
+        samples.append(timer() - start)
+    samples.sort()
+    sent = lambda cls: sum(dp.count(cls) for dp in datapaths.values())
+    return {'variant': variant, 'scenario': scenario, 'packet_ins': len(samples),
+            'rate': len(samples) / sum(samples),
+            'p50_us': percentile(samples, 0.50) * 1e6, 'p99_us': percentile(samples, 0.99) * 1e6,
+            'flow_mods': sent(ofproto_v1_3_parser.OFPFlowMod),
+            'packet_outs': sent(ofproto_v1_3_parser.OFPPacketOut)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=10000, help='packet-ins per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--variants', nargs='+', default=VARIANTS)
+    parser.add_argument('--scenarios', nargs='+', default=[name for name, _ in SCENARIOS])
+    parser.add_argument('--metrics', action='store_true', help='enable the apps\' counters and histograms')
+    parser.add_argument('--proxy-arp', action='store_true', help='answer ARP requests from the controller')
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print('%-18s %-8s %10s %9s %9s %9s %9s' % ('variant', 'scenario', 'pkt-in/s', 'p50 us', 'p99 us', 'flowmods', 'pkt-outs'))
+    for variant in args.variants:
+        for scenario in args.scenarios:
+            r = run(variant, scenario, args.n, args.seed, args.metrics, args.proxy_arp)
+            print('%-18s %-8s %10.0f %9.1f %9.1f %9d %9d' % (r['variant'], r['scenario'], r['rate'], r['p50_us'],
+                                                             r['p99_us'], r['flow_mods'], r['packet_outs']))
+
+if __name__ == '__main__':
+    main()
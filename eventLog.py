@@ -0,0 +1,126 @@
+import json
+import logging
+import time
+from collections import deque
+
+from ryu.lib import hub
+
+class Sampler(logging.Filter):
+    """Passes 1 in `every` records of each message below WARNING."""
+
+    def __init__(self, every=1):
+        logging.Filter.__init__(self)
+        self.every = every
+        self.seen = {}
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        count = self.seen.get(record.msg, 0)
+        self.seen[record.msg] = count + 1
+        return count % self.every == 0
+
+class AsyncHandler(logging.Handler):
+    """Queues records and hands them to `targets` from a hub thread.
+
+    Formatting happens in the targets, so the caller only pays for the
+    LogRecord and a deque append. When the queue is full the oldest
+    records are dropped and counted.
+    """
+
+    def __init__(self, targets, capacity=10000, interval=0.1):
+        logging.Handler.__init__(self)
+        self.targets = targets
+        self.queue = deque(maxlen=capacity)
+        self.interval = interval
+        self.dropped = 0
+
+    def emit(self, record):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(record)
+
+    def drain(self):
+        queue = self.queue
+        while queue:
+            record = queue.popleft()
+            for target in self.targets:
+                if record.levelno >= target.level:
+                    target.handle(record)
+
+    def _drain_loop(self):
+        while True:
+            hub.sleep(self.interval)
+            self.drain()
+
+    def start(self):
+        return hub.spawn(self._drain_loop)
+
+def install(logger, sample=1, capacity=10000):
+    """Moves logger onto an AsyncHandler feeding the root handlers."""
+    targets = logging.getLogger().handlers or [logging.StreamHandler()]
+    handler = AsyncHandler(list(targets), capacity)
+    handler.addFilter(Sampler(sample))
+    logger.addHandler(handler)
+    logger.propagate = False
+    return handler
+
+# field names of each trace event, in emit() argument order
+EVENTS = {
+    'packet_in': ('dpid', 'in_port', 'vlan', 'src', 'dst'),
+    'flow_mod': ('dpid', 'table_id', 'priority'),
+    'flood': ('dpid', 'vlan', 'in_port'),
+    'move': ('dpid', 'vlan', 'mac', 'old_port', 'port'),
+}
+
+class EventTrace(object):
+    """Bounded in-memory event queue written out as JSON lines.
+
+    emit() stores a tuple and returns; a hub thread turns queued events
+    into {"t": ..., "ev": kind, <fields>} lines every interval seconds.
+    `sample` keeps 1 in that many events of each kind.
+    """
+
+    def __init__(self, path, sample=1, capacity=100000, interval=0.5, clock=time.time):
+        self.path = path
+        self.sample = sample
+        self.queue = deque(maxlen=capacity)
+        self.interval = interval
+        self.clock = clock
+        self.counts = dict.fromkeys(EVENTS, 0)
+        self.dropped = 0
+        self.written = 0
+        self.out = None
+
+    def emit(self, kind, *args):
+        count = self.counts[kind]
+        self.counts[kind] = count + 1
+        if count % self.sample:
+            return
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((self.clock(), kind, args))
+
+    def flush(self):
+        if not self.queue:
+            return
+        if self.out is None:
+            self.out = open(self.path, 'a')
+        lines = []
+        queue = self.queue
+        while queue:
+            t, kind, args = queue.popleft()
+            event = dict(zip(EVENTS[kind], args))
+            event['t'], event['ev'] = round(t, 6), kind
+            lines.append(json.dumps(event, separators=(',', ':'), sort_keys=True))
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+        self.written += len(lines)
+
+    def _flush_loop(self):
+        while True:
+            hub.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        return hub.spawn(self._flush_loop)
@@ -0,0 +1,54 @@
+import struct
+
+ETH_TYPE_8021Q = 0x8100
+ETH_TYPE_IP = 0x0800
+ETH_HLEN = 14
+VLAN_HLEN = 4
+
+_MAC_FMT = '%02x:%02x:%02x:%02x:%02x:%02x'
+_mac = struct.Struct('!6B').unpack_from
+_u16 = struct.Struct('!H').unpack_from
+_u8 = struct.Struct('!B').unpack_from
+
+class Frame(object):
+    """Ethernet/802.1Q header read straight from the packet-in buffer.
+
+    Only the fields the switching apps need on every packet-in are decoded:
+    dst, src, ethertype (after the tag), vid (None if untagged) and dscp
+    (None if not IPv4). `header` gives the full ryu parse, built on demand.
+    """
+    __slots__ = ('data', 'dst', 'src', 'ethertype', 'vid', 'dscp', 'l3_offset', '_header')
+
+    def __init__(self, data):
+        buf = memoryview(data)
+        self.data = data
+        self.dst = _MAC_FMT % _mac(buf, 0)
+        self.src = _MAC_FMT % _mac(buf, 6)
+        ethertype, = _u16(buf, 12)
+        offset = ETH_HLEN
+        self.vid = None
+        if ethertype == ETH_TYPE_8021Q and len(buf) >= ETH_HLEN + VLAN_HLEN:
+            tci, ethertype = struct.unpack_from('!HH', buf, offset)
+            self.vid = tci & 0x0fff
+            offset += VLAN_HLEN
+        self.ethertype = ethertype
+        self.l3_offset = offset
+        self.dscp = None
+        if ethertype == ETH_TYPE_IP and len(buf) > offset + 1:
+            self.dscp = _u8(buf, offset + 1)[0] >> 2
+        self._header = None
+
+    @property
+    def header(self):
+        # fall back to the full ryu decode only when a deeper header is needed
+        if self._header is None:
+            from ryu.lib.packet import packet
+            pkt = packet.Packet(self.data)
+            self._header = dict((p.protocol_name, p) for p in pkt.protocols if type(p) != str)
+        return self._header
+
+def parse(data):
+    """Returns a Frame for data, or None if it is too short to be Ethernet."""
+    if data is None or len(data) < ETH_HLEN:
+        return None
+    return Frame(data)
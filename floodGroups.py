@@ -0,0 +1,88 @@
+VLAN_TAG_802_1Q = 0x8100
+
+def groupId(vlan, tagged):
+    """Group of the (vlan, ingress tagged or not) flood domain."""
+    return (int(vlan) << 1) | (1 if tagged else 0)
+
+class FloodGroups(object):
+    """One OpenFlow ALL group per (dpid, vlan, ingress tagging) flood domain.
+
+    Untagged floods copy the packet as-is to the access ports and tag it
+    for the trunks; tagged floods pass the tag along the trunks and strip
+    it for the access ports. Output to the ingress port is dropped by the
+    switch, so one group serves every in_port of the VLAN. Ports listed as
+    both access and trunk are treated as trunks.
+
+    Apps that never tag (vlanSwitching) pass tagging=False and get one
+    group per VLAN that outputs frames as they came in to all its ports.
+    """
+
+    def __init__(self, tagging=True):
+        self.tagging = tagging
+        self.datapaths = {}
+        self.installed = {}
+
+    def specs(self, vlans):
+        """Returns {group_id: (vlan, tagged, access, trunk)} for {vlanID: PortSets}."""
+        specs = {}
+        for vlan, ports in vlans.items():
+            if not self.tagging:
+                specs[groupId(vlan, False)] = (vlan, False, tuple(sorted(ports.all)), ())
+                continue
+            access = tuple(sorted(ports.access - ports.trunk))
+            trunk = tuple(sorted(ports.trunk))
+            for tagged in (False, True):
+                specs[groupId(vlan, tagged)] = (vlan, tagged, access, trunk)
+        return specs
+
+    def _groupMod(self, datapath, command, group_id, spec=None):
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        buckets = []
+        if spec is not None:
+            vlan, tagged, access, trunk = spec
+            vid = int(vlan) | OF.OFPVID_PRESENT
+            pop = [parser.OFPActionPopVlan()] if tagged else []
+            push = [] if tagged else [parser.OFPActionPushVlan(VLAN_TAG_802_1Q), parser.OFPActionSetField(vlan_vid=vid)]
+            for port in access:
+                buckets.append(parser.OFPBucket(actions=pop + [parser.OFPActionOutput(port)]))
+            for port in trunk:
+                buckets.append(parser.OFPBucket(actions=push + [parser.OFPActionOutput(port)]))
+        return parser.OFPGroupMod(datapath, command, OF.OFPGT_ALL, group_id, buckets)
+
+    def install(self, datapath, vlans):
+        """Replaces whatever groups the switch has with the flood groups."""
+        OF = datapath.ofproto
+        datapath.send_msg(self._groupMod(datapath, OF.OFPGC_DELETE, OF.OFPG_ALL))
+        self.datapaths[datapath.id] = datapath
+        self.installed[datapath.id] = {}
+        self.sync(datapath, vlans)
+
+    def sync(self, datapath, vlans):
+        """Adds, modifies or deletes only the groups whose ports changed."""
+        OF = datapath.ofproto
+        installed = self.installed.setdefault(datapath.id, {})
+        wanted = self.specs(vlans)
+        for group_id in [g for g in installed if g not in wanted]:
+            datapath.send_msg(self._groupMod(datapath, OF.OFPGC_DELETE, group_id))
+            del installed[group_id]
+        for group_id, spec in wanted.items():
+            if installed.get(group_id) == spec:
+                continue
+            command = OF.OFPGC_MODIFY if group_id in installed else OF.OFPGC_ADD
+            datapath.send_msg(self._groupMod(datapath, command, group_id, spec))
+            installed[group_id] = spec
+
+    def resync(self, port_sets):
+        for dpid, datapath in self.datapaths.items():
+            self.sync(datapath, port_sets.vlans(dpid))
+
+    def forget(self, dpid):
+        self.datapaths.pop(dpid, None)
+        self.installed.pop(dpid, None)
+
+    def action(self, datapath, vlan, tagged):
+        """Group action flooding vlan, or None if the switch has no such group."""
+        group_id = groupId(vlan, tagged and self.tagging)
+        if group_id not in self.installed.get(datapath.id, ()):
+            return None
+        return datapath.ofproto_parser.OFPActionGroup(group_id)
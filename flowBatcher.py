@@ -0,0 +1,86 @@
+import logging
+import time
+
+from ryu.lib import hub
+
+class _Batch(object):
+    __slots__ = ('datapath', 'msgs', 'since')
+
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.msgs = []
+        self.since = 0
+
+class FlowBatcher(object):
+    """Groups flow-mods per datapath and commits them with a barrier.
+
+    Messages queued with add() are serialized into one buffer and written
+    to the switch in a single send, followed by an OFPBarrierRequest, once
+    `max_batch` messages are pending or the oldest one has waited
+    `max_delay` seconds. When the barrier reply comes back (the app must
+    pass EventOFPBarrierReply messages to barrier_reply) `on_commit` is
+    called with (dpid, count, seconds) for that batch.
+    """
+
+    def __init__(self, max_batch=64, max_delay=0.01, on_commit=None, logger=None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.on_commit = on_commit or self._log_commit
+        self.queues = {}
+        self.pending = {}
+        self.batches = 0
+
+    def _log_commit(self, dpid, count, elapsed):
+        self.logger.debug("batch of %s messages committed on %s in %.3f ms", count, dpid, elapsed * 1000)
+
+    def add(self, datapath, msg):
+        batch = self.queues.get(datapath.id)
+        if batch is None:
+            batch = self.queues[datapath.id] = _Batch(datapath)
+        if not batch.msgs:
+            batch.since = time.time()
+        batch.msgs.append(msg)
+        if len(batch.msgs) >= self.max_batch:
+            self.flush(datapath.id)
+
+    def flush(self, dpid=None):
+        for id in ([dpid] if dpid is not None else list(self.queues)):
+            batch = self.queues.get(id)
+            if batch is None or not batch.msgs:
+                continue
+            datapath, msgs = batch.datapath, batch.msgs
+            batch.msgs = []
+            barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+            bufs = []
+            for msg in msgs + [barrier]:
+                datapath.set_xid(msg)
+                msg.serialize()
+                bufs.append(bytes(msg.buf))
+            self.pending[barrier.xid] = (id, len(msgs), time.time())
+            self.batches += 1
+            datapath.send(b''.join(bufs))
+
+    def discard(self, dpid):
+        self.queues.pop(dpid, None)
+        for xid in [x for x, p in self.pending.items() if p[0] == dpid]:
+            del self.pending[xid]
+
+    def barrier_reply(self, msg):
+        pending = self.pending.pop(msg.xid, None)
+        if pending is None:
+            return False
+        dpid, count, sent = pending
+        self.on_commit(dpid, count, time.time() - sent)
+        return True
+
+    def _flush_loop(self):
+        while True:
+            hub.sleep(self.max_delay)
+            deadline = time.time() - self.max_delay
+            for id, batch in list(self.queues.items()):
+                if batch.msgs and batch.since <= deadline:
+                    self.flush(id)
+
+    def start(self):
+        return hub.spawn(self._flush_loop)
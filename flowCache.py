@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+from ryu.lib.pack_utils import msg_pack_into
+from ryu.ofproto.ofproto_v1_3_parser import OFPInstruction
+
+VLAN_TAG_802_1Q = 0x8100
+# tag_op bits for FlowCache.get
+PUSH = 1
+POP = 2
+NO_OUTPUT = 4
+
+class SerializedInstruction(OFPInstruction):
+    """Wraps an OFPInstruction whose wire bytes are computed only once."""
+
+    def __init__(self, inst):
+        buf = bytearray()
+        inst.serialize(buf, 0)
+        self.inst = inst
+        self.len = inst.len
+        self.raw = bytes(buf[:inst.len])
+
+    def serialize(self, buf, offset):
+        msg_pack_into('!%ds' % self.len, buf, offset, self.raw)
+
+    def __repr__(self):
+        return repr(self.inst)
+
+class LearnedActions(object):
+    """Prebuilt actions and instructions for one learned destination.
+
+    `actions` (apply) and `write` are what the handlers used to build by
+    hand, `out` is their concatenation for the packet-out. None of these
+    lists may be modified by the caller.
+    """
+    __slots__ = ('datapath', 'actions', 'write', 'out', '_instructions')
+
+    def __init__(self, datapath, actions, write):
+        self.datapath = datapath
+        self.actions = actions
+        self.write = write
+        self.out = actions + write
+        self._instructions = {}
+
+    def instructions(self, meter_id=0):
+        inst = self._instructions.get(meter_id)
+        if inst is None:
+            OF, parser = self.datapath.ofproto, self.datapath.ofproto_parser
+            inst = []
+            if self.actions: inst.append(parser.OFPInstructionActions(OF.OFPIT_APPLY_ACTIONS, self.actions))
+            inst.append(parser.OFPInstructionActions(OF.OFPIT_WRITE_ACTIONS, self.write))
+            if meter_id: inst.append(parser.OFPInstructionMeter(meter_id))
+            inst = self._instructions[meter_id] = [SerializedInstruction(i) for i in inst]
+        return inst
+
+class FlowCache(object):
+    """Bounded LRU of LearnedActions keyed by (dpid, vlan, out_port, tag_op).
+
+    tag_op is a mask of PUSH (tag with vlan), POP (strip the tag) and
+    NO_OUTPUT. The apps invalidate a datapath's entries when its ports
+    change, and the whole cache when the VLAN maps are recompiled.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, datapath, vlan, out_port, tag_op=0):
+        key = (datapath.id, vlan, out_port, tag_op)
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry.datapath is datapath:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self._build(datapath, vlan, out_port, tag_op)
+        self.entries[key] = entry
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return entry
+
+    def _build(self, datapath, vlan, out_port, tag_op):
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        actions = []
+        if tag_op & PUSH:
+            field = parser.OFPMatchField.make(OF.OXM_OF_VLAN_VID, vlan)
+            actions += [parser.OFPActionPushVlan(VLAN_TAG_802_1Q), parser.OFPActionSetField(field)]
+        if tag_op & POP:
+            actions.append(parser.OFPActionPopVlan())
+        write = [] if tag_op & NO_OUTPUT else [parser.OFPActionOutput(out_port)]
+        return LearnedActions(datapath, actions, write)
+
+    def invalidate(self, dpid=None):
+        if dpid is None:
+            self.entries.clear()
+            return
+        for key in [k for k in self.entries if k[0] == dpid]:
+            del self.entries[key]
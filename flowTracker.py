@@ -0,0 +1,80 @@
+# OFPFlowRemoved reasons
+REASONS = {0: 'idle_timeout', 1: 'hard_timeout', 2: 'delete', 3: 'group_delete'}
+
+def flowKey(table_id, priority, match):
+    """Identifies a flow the way the switch does, by table, priority and match."""
+    return (table_id, priority, tuple(sorted(match.items())))
+
+class FlowTracker(object):
+    """Learned flows installed with OFPFF_SEND_FLOW_REM, per datapath.
+
+    A station (vlan, mac) stays learned while at least one of its flows is
+    on the switch; removed() reports the station once its last flow is
+    gone so the MAC table can drop it too. vlan_timeouts maps a VLAN to
+    (idle, hard) seconds, None in either falls back to the defaults.
+    """
+
+    def __init__(self, idle_timeout=0, hard_timeout=0, vlan_timeouts=None):
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.vlan_timeouts = vlan_timeouts or {}
+        self.flows = {}
+        self.stations = {}
+        self.counters = {}
+
+    def timeouts(self, vlan):
+        idle, hard = self.vlan_timeouts.get(vlan, (None, None))
+        return (self.idle_timeout if idle is None else idle,
+                self.hard_timeout if hard is None else hard)
+
+    def _count(self, dpid, name):
+        counters = self.counters.setdefault(dpid, {})
+        counters[name] = counters.get(name, 0) + 1
+
+    def add(self, datapath, table_id, priority, match, vlan, mac):
+        """Records a learned flow, returns the timeout and flag kwargs for its OFPFlowMod."""
+        dpid = datapath.id
+        flows = self.flows.setdefault(dpid, {})
+        stations = self.stations.setdefault(dpid, {})
+        key, station = flowKey(table_id, priority, match), (vlan, mac)
+        old = flows.get(key)
+        if old != station:
+            # an identical match replaces the flow on the switch
+            if old is not None:
+                self._release(stations, old)
+            stations[station] = stations.get(station, 0) + 1
+            flows[key] = station
+        self._count(dpid, 'added')
+        idle, hard = self.timeouts(vlan)
+        return {'idle_timeout': idle, 'hard_timeout': hard, 'flags': datapath.ofproto.OFPFF_SEND_FLOW_REM}
+
+    def _release(self, stations, station):
+        stations[station] -= 1
+        if stations[station]:
+            return False
+        del stations[station]
+        return True
+
+    def removed(self, msg):
+        """Handles an OFPFlowRemoved, returns the (vlan, mac) left without flows or None."""
+        dpid = msg.datapath.id
+        self._count(dpid, REASONS.get(msg.reason, 'other'))
+        station = self.flows.get(dpid, {}).pop(flowKey(msg.table_id, msg.priority, msg.match), None)
+        if station is None or not self._release(self.stations[dpid], station):
+            return None
+        return station
+
+    def forget(self, dpid):
+        self.flows.pop(dpid, None)
+        self.stations.pop(dpid, None)
+
+    def occupancy(self, dpid):
+        return len(self.flows.get(dpid, ()))
+
+    def stats(self):
+        """{dpid: counters plus current learned flow and station counts}."""
+        stats = {}
+        for dpid in set(self.flows) | set(self.counters):
+            stats[dpid] = dict(self.counters.get(dpid, {}), flows=self.occupancy(dpid),
+                               stations=len(self.stations.get(dpid, ())))
+        return stats
@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+
+def mac_to_int(mac):
+    return int(mac.replace(':', ''), 16)
+
+def pack(vlan, mac):
+    """Packs a VLAN and a 'xx:xx:xx:xx:xx:xx' MAC into one integer key."""
+    return (int(vlan) << 48) | mac_to_int(mac)
+
+def unpack(key):
+    mac = '%012x' % (key & 0xffffffffffff)
+    return key >> 48, ':'.join(mac[i:i+2] for i in range(0, 12, 2))
+
+class MacTable(object):
+    """Bounded, aging MAC learning table scoped by datapath and VLAN.
+
+    Each datapath has its own table of at most `capacity` entries, keyed by
+    pack(vlan, mac) and kept in least-recently-learned order. Entries not
+    refreshed within `max_age` seconds are dropped; when a table is full the
+    least recently learned entry is evicted.
+    """
+
+    def __init__(self, capacity=4096, max_age=300, clock=time.time):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.clock = clock
+        self.tables = {}
+        self.moves = 0
+        self.evictions = 0
+
+    def learn(self, dpid, vlan, mac, port):
+        """Learns mac on port, returns the previous port if the station moved."""
+        table = self.tables.get(dpid)
+        if table is None:
+            table = self.tables[dpid] = OrderedDict()
+        now = self.clock()
+        key = pack(vlan, mac)
+        old = table.pop(key, None)
+        table[key] = (port, now)
+        self._expire(table, now)
+        while len(table) > self.capacity:
+            table.popitem(last=False)
+            self.evictions += 1
+        if old is not None and old[0] != port:
+            self.moves += 1
+            return old[0]
+        return None
+
+    def lookup(self, dpid, vlan, mac):
+        table = self.tables.get(dpid)
+        if table is None:
+            return None
+        key = pack(vlan, mac)
+        entry = table.get(key)
+        if entry is None:
+            return None
+        if self.max_age and self.clock() - entry[1] > self.max_age:
+            del table[key]
+            return None
+        return entry[0]
+
+    def _expire(self, table, now):
+        if not self.max_age:
+            return
+        deadline = now - self.max_age
+        while table:
+            key = next(iter(table))
+            if table[key][1] > deadline:
+                break
+            del table[key]
+
+    def expire(self):
+        now = self.clock()
+        for table in self.tables.values():
+            self._expire(table, now)
+
+    def flush(self, dpid=None, vlan=None, port=None):
+        """Removes matching entries, returns the list of (dpid, vlan, mac) removed."""
+        removed = []
+        for id in ([dpid] if dpid is not None else list(self.tables)):
+            table = self.tables.get(id, {})
+            for key in list(table):
+                if vlan is not None and key >> 48 != int(vlan):
+                    continue
+                if port is not None and table[key][0] != port:
+                    continue
+                del table[key]
+                removed.append((id,) + unpack(key))
+        return removed
+
+    def forget(self, dpid, vlan, mac):
+        """Removes one station, returns its port or None if it was not known."""
+        entry = self.tables.get(dpid, {}).pop(pack(vlan, mac), None)
+        return entry and entry[0]
+
+    def restore(self, dpid, vlan, mac, port, learned):
+        """Re-inserts a saved entry as learned at `learned`, oldest first."""
+        table = self.tables.get(dpid)
+        if table is None:
+            table = self.tables[dpid] = OrderedDict()
+        table[pack(vlan, mac)] = (port, learned)
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
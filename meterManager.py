@@ -0,0 +1,190 @@
+from ryu.lib import hub
+
+def maxMinFair(capacity, demands, weights=None):
+    """Weighted max-min fair split of capacity, returns {key: allocation}.
+
+    Keys demanding less than their weighted share get their demand and the
+    rest is split again among the others. Whatever is left once everyone
+    is satisfied is handed out by weight too, so the split is work-conserving.
+    """
+    if weights is None:
+        weights = dict.fromkeys(demands, 1)
+    alloc = dict.fromkeys(demands, 0.0)
+    left = dict(demands)
+    while left:
+        share = float(capacity) / sum(weights[k] for k in left)
+        satisfied = [k for k in left if left[k] <= share * weights[k]]
+        if not satisfied:
+            for k in left:
+                alloc[k] = share * weights[k]
+            return alloc
+        for k in satisfied:
+            alloc[k] = left.pop(k)
+            capacity -= alloc[k]
+    total = sum(weights.values())
+    if capacity > 0 and total:
+        for k in alloc:
+            alloc[k] += capacity * weights[k] / float(total)
+    return alloc
+
+class _Meter(object):
+    __slots__ = ('vlan', 'nominal', 'rate', 'demand', 'last')
+
+    def __init__(self, vlan, nominal):
+        self.vlan = vlan
+        self.nominal = nominal
+        self.rate = nominal
+        self.demand = None
+        self.last = None
+
+class MeterManager(object):
+    """Rebalances the DSCP remark meters of each datapath from their stats.
+
+    Every interval seconds it asks each datapath for meter stats. A VLAN's
+    demand is its measured meter rate times headroom; the meters of a
+    datapath then share the sum of their nominal rates max-min fairly,
+    weighted by nominal rate, and only meters whose rate moved by more than
+    threshold are sent an OFPMC_MODIFY. With link_capacity (kbps) set, port
+    stats are polled too and the pool grows to whatever the busiest port
+    leaves unused. Only replies to its own requests are used.
+    """
+
+    def __init__(self, interval=10, headroom=1.2, min_rate=64, burst=10,
+                 threshold=0.05, link_capacity=None, logger=None):
+        self.interval = interval
+        self.headroom = headroom
+        self.min_rate = min_rate
+        self.burst = burst
+        self.threshold = threshold
+        self.link_capacity = link_capacity
+        self.logger = logger
+        self.datapaths = {}
+        self.meters = {}
+        self.ports = {}
+        # {(dpid, kind): xid} of the requests not fully answered yet
+        self.pending = {}
+        self.modifies = 0
+
+    def meterMod(self, datapath, command, meter_id, rate):
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        bands = [parser.OFPMeterBandDscpRemark(rate=int(rate), burst_size=self.burst, prec_level=4)]
+        return parser.OFPMeterMod(datapath=datapath, command=command, flags=OF.OFPMF_KBPS,
+                                  meter_id=meter_id, bands=bands)
+
+    def add(self, datapath, vlan, meter_id, rate, command=None):
+        """Installs a meter at its nominal rate and starts managing it.
+
+        command defaults to OFPMC_ADD, OFPMC_MODIFY resets a meter the
+        switch already has.
+        """
+        if command is None:
+            command = datapath.ofproto.OFPMC_ADD
+        self.datapaths[datapath.id] = datapath
+        self.meters.setdefault(datapath.id, {})[meter_id] = _Meter(vlan, rate)
+        datapath.send_msg(self.meterMod(datapath, command, meter_id, rate))
+
+    def remove(self, dpid, meter_id):
+        self.meters.get(dpid, {}).pop(meter_id, None)
+
+    def forget(self, dpid):
+        self.datapaths.pop(dpid, None)
+        self.meters.pop(dpid, None)
+        self.ports.pop(dpid, None)
+        self.pending.pop((dpid, 'meter'), None)
+        self.pending.pop((dpid, 'port'), None)
+
+    def request(self, datapath):
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        req = parser.OFPMeterStatsRequest(datapath, 0, OF.OFPM_ALL)
+        datapath.send_msg(req)
+        self.pending[(datapath.id, 'meter')] = req.xid
+        if self.link_capacity:
+            req = parser.OFPPortStatsRequest(datapath, 0, OF.OFPP_ANY)
+            datapath.send_msg(req)
+            self.pending[(datapath.id, 'port')] = req.xid
+
+    def _ours(self, kind, msg):
+        # statsCollector asks for the same stats, its replies are not ours
+        key = (msg.datapath.id, kind)
+        if msg.xid is None or self.pending.get(key) != msg.xid:
+            return False
+        if not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            del self.pending[key]
+        return True
+
+    @staticmethod
+    def _rate(last, count, seconds):
+        # kbps between two (bytes, seconds) samples, None on the first one
+        if last is None or seconds <= last[1] or count < last[0]:
+            return None
+        return (count - last[0]) * 8 / 1000.0 / (seconds - last[1])
+
+    def meterStats(self, msg):
+        if not self._ours('meter', msg):
+            return
+        datapath = msg.datapath
+        meters = self.meters.get(datapath.id, {})
+        for stat in msg.body:
+            meter = meters.get(stat.meter_id)
+            if meter is None:
+                continue
+            sample = (stat.byte_in_count, stat.duration_sec + stat.duration_nsec / 1e9)
+            rate = self._rate(meter.last, *sample)
+            meter.last = sample
+            if rate is not None:
+                meter.demand = rate
+        if not msg.flags & datapath.ofproto.OFPMPF_REPLY_MORE:
+            self.reallocate(datapath)
+
+    def portStats(self, msg):
+        if not self._ours('port', msg):
+            return
+        ports = self.ports.setdefault(msg.datapath.id, {})
+        for stat in msg.body:
+            last = ports.get(stat.port_no)
+            seconds = stat.duration_sec + stat.duration_nsec / 1e9
+            rate = self._rate(last and last[:2], stat.tx_bytes, seconds)
+            ports[stat.port_no] = (stat.tx_bytes, seconds, rate if rate is not None else (last and last[2]))
+
+    def capacity(self, dpid):
+        meters = self.meters.get(dpid, {})
+        pool = sum(m.nominal for m in meters.values())
+        if self.link_capacity:
+            busiest = max([p[2] or 0 for p in self.ports.get(dpid, {}).values()] or [0])
+            metered = sum(m.demand or 0 for m in meters.values())
+            pool = max(pool, self.link_capacity - max(0, busiest - metered))
+        return pool
+
+    def reallocate(self, datapath):
+        """Sends OFPMC_MODIFY for the meters whose fair rate changed."""
+        meters = self.meters.get(datapath.id, {})
+        if not meters or any(m.demand is None for m in meters.values()):
+            return
+        demands = dict((mid, m.demand * self.headroom) for mid, m in meters.items())
+        weights = dict((mid, m.nominal) for mid, m in meters.items())
+        alloc = maxMinFair(self.capacity(datapath.id), demands, weights)
+        for meter_id, rate in sorted(alloc.items()):
+            meter = meters[meter_id]
+            rate = max(self.min_rate, int(rate))
+            if abs(rate - meter.rate) <= self.threshold * meter.nominal:
+                continue
+            if self.logger is not None:
+                self.logger.info("meter %s on %s V: %s: %s -> %s kbps (demand %.0f)",
+                                 meter_id, datapath.id, meter.vlan, meter.rate, rate, meter.demand)
+            meter.rate = rate
+            self.modifies += 1
+            datapath.send_msg(self.meterMod(datapath, datapath.ofproto.OFPMC_MODIFY, meter_id, rate))
+
+    def stats(self):
+        return dict((dpid, dict((mid, {'vlan': m.vlan, 'nominal': m.nominal, 'rate': m.rate, 'demand': m.demand})
+                                for mid, m in meters.items()))
+                    for dpid, meters in self.meters.items())
+
+    def _poll_loop(self):
+        while True:
+            for datapath in list(self.datapaths.values()):
+                self.request(datapath)
+            hub.sleep(self.interval)
+
+    def start(self):
+        return hub.spawn(self._poll_loop)
@@ -0,0 +1,111 @@
+"""Packet-in trace files for offline replay, see replay.py.
+
+A trace is MAGIC followed by one block per packet-in, loosely after
+pcapng: block type, block length, timestamp, dpid, in_port, buffer_id and
+the length of the raw frame, then the frame padded to 4 bytes. Blocks are
+written straight into a memory-mapped file that grows by doubling; the
+block length goes in last, so a reader stops at the first zero length and
+a crash mid-record only loses that record. close() cuts the file down to
+what was written.
+"""
+import collections
+import mmap
+import os
+import struct
+import time
+
+from ryu.lib import hub
+
+MAGIC = b'VPKT0001'
+PACKET_IN = 1
+# type, block length, time, dpid, in_port, buffer_id, frame length
+BLOCK = struct.Struct('!IIdQIII')
+_length = struct.Struct('!I')
+
+Record = collections.namedtuple('Record', 'time dpid in_port buffer_id data')
+
+class TraceRecorder(object):
+    """Appends packet-ins to a trace file, cheap enough for the event loop.
+
+    The file starts at size bytes and doubles up to max_size; packet-ins
+    that no longer fit are counted in dropped.
+    """
+
+    def __init__(self, path, size=1 << 24, max_size=1 << 32, clock=time.time):
+        self.path = path
+        self.max_size = max_size
+        self.clock = clock
+        self.recorded = self.dropped = 0
+        self.file = open(path, 'w+b')
+        self.file.write(MAGIC)
+        self.file.truncate(max(size, len(MAGIC) + BLOCK.size))
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.buf = mmap.mmap(self.file.fileno(), self.size)
+        self.offset = len(MAGIC)
+
+    def _grow(self, needed):
+        size = self.size
+        while size < needed:
+            size *= 2
+        if size > self.max_size:
+            return False
+        self.buf.close()
+        self.file.truncate(size)
+        self.size = size
+        self.buf = mmap.mmap(self.file.fileno(), size)
+        return True
+
+    def add(self, t, dpid, in_port, buffer_id, data):
+        length = BLOCK.size + ((len(data) + 3) & ~3)
+        end = self.offset + length
+        # room for the zero length that ends the trace
+        if end + 4 > self.size and not self._grow(end + 4):
+            self.dropped += 1
+            return
+        buf, offset = self.buf, self.offset
+        BLOCK.pack_into(buf, offset, PACKET_IN, 0, t, dpid, in_port, buffer_id, len(data))
+        buf[offset + BLOCK.size:offset + BLOCK.size + len(data)] = bytes(data)
+        _length.pack_into(buf, offset + 4, length)
+        self.offset = end
+        self.recorded += 1
+
+    def record(self, msg):
+        self.add(self.clock(), msg.datapath.id, msg.match['in_port'], msg.buffer_id, msg.data)
+
+    def flush(self):
+        self.buf.flush()
+
+    def _flush_loop(self, interval):
+        while True:
+            hub.sleep(interval)
+            self.flush()
+
+    def start(self, interval=1):
+        return hub.spawn(self._flush_loop, interval)
+
+    def close(self):
+        self.buf.flush()
+        self.buf.close()
+        self.file.truncate(self.offset)
+        self.file.close()
+
+def read(path):
+    """Yields the Records of a trace file in the order they were recorded."""
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if buf[:len(MAGIC)] != MAGIC:
+                raise ValueError("%s is not a packet trace" % path)
+            offset = len(MAGIC)
+            while offset + BLOCK.size <= len(buf):
+                kind, length, t, dpid, in_port, buffer_id, size = BLOCK.unpack_from(buf, offset)
+                if not length or offset + length > len(buf):
+                    break
+                if kind == PACKET_IN:
+                    start = offset + BLOCK.size
+                    yield Record(t, dpid, in_port, buffer_id, buf[start:start + size])
+                offset += length
+        finally:
+            buf.close()
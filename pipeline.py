@@ -0,0 +1,76 @@
+from collections import namedtuple
+
+VLAN_TAG_802_1Q = 0x8100
+# table ids of the VLAN classify -> MAC learn -> forward pipeline
+CLASSIFY_TABLE = 0
+LEARN_TABLE = 1
+FORWARD_TABLE = 2
+
+PipelineFlow = namedtuple('PipelineFlow', 'table_id priority match actions goto meter_id')
+
+def _flow(table_id, priority, match, actions=(), goto=None, meter_id=0):
+    return PipelineFlow(table_id, priority, match, list(actions), goto, meter_id)
+
+def vlanVid(OF, vlan, vid_mask=0x1fff):
+    """OXM vlan_vid value for vlan, untagged for the default VLAN 1."""
+    if int(vlan) == 1:
+        return OF.OFPVID_NONE
+    return (int(vlan) | OF.OFPVID_PRESENT, vid_mask)
+
+def baseFlows(datapath, vlans, vid_mask=0x1fff, meters=None, miss_meter=0):
+    """Yields the flows a datapath needs when it connects in pipeline mode.
+
+    vlans is {vlanID: PortSets} for the datapath and meters an optional
+    {vlanID: meterID} applied to traffic entering on access ports.
+    miss_meter, if set, meters the table 1 miss; packets of unknown
+    sources above its rate are dropped instead of punted and flooded.
+
+    table 0 tags untagged traffic from access ports and passes tagged
+    traffic from trunks; everything else goes on untouched. table 1 sends
+    unknown sources to the controller and continues to table 2, where
+    unknown destinations are flooded within their VLAN.
+    """
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    meters = meters or {}
+    to_controller = parser.OFPActionOutput(OF.OFPP_CONTROLLER, OF.OFPCML_NO_BUFFER)
+    yield _flow(CLASSIFY_TABLE, 0, parser.OFPMatch(), goto=LEARN_TABLE)
+    yield _flow(LEARN_TABLE, 0, parser.OFPMatch(), [to_controller], FORWARD_TABLE, miss_meter)
+    yield _flow(FORWARD_TABLE, 0, parser.OFPMatch())
+    yield _flow(FORWARD_TABLE, 1, parser.OFPMatch(vlan_vid=OF.OFPVID_NONE),
+                [parser.OFPActionOutput(OF.OFPP_FLOOD)])
+    for vlan, ports in vlans.items():
+        vid = int(vlan) | OF.OFPVID_PRESENT
+        access = ports.access - ports.trunk
+        for port in access:
+            match = parser.OFPMatch(in_port=port, vlan_vid=OF.OFPVID_NONE)
+            actions = [parser.OFPActionPushVlan(VLAN_TAG_802_1Q), parser.OFPActionSetField(vlan_vid=vid)]
+            yield _flow(CLASSIFY_TABLE, 1, match, actions, LEARN_TABLE, meters.get(vlan, 0))
+        for port in ports.trunk:
+            match = parser.OFPMatch(in_port=port, vlan_vid=(vid, vid_mask))
+            yield _flow(CLASSIFY_TABLE, 1, match, goto=LEARN_TABLE)
+        actions = [parser.OFPActionOutput(p) for p in sorted(ports.trunk)]
+        if access:
+            actions += [parser.OFPActionPopVlan()] + [parser.OFPActionOutput(p) for p in sorted(access)]
+        yield _flow(FORWARD_TABLE, 1, parser.OFPMatch(vlan_vid=(vid, vid_mask)), actions)
+
+def learnFlows(datapath, vlan, mac, port, trunk_ports=(), vid_mask=0x1fff):
+    """Yields the table 1 and table 2 entries for a host learned on port.
+
+    The table 1 entry only matches the host on port, so once it moves its
+    traffic misses and reaches the controller again; the table 2 entry
+    then replaces the old one, it has the same match.
+    """
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    vid = vlanVid(OF, vlan, vid_mask)
+    yield _flow(LEARN_TABLE, 1, parser.OFPMatch(in_port=port, vlan_vid=vid, eth_src=mac), goto=FORWARD_TABLE)
+    actions = [parser.OFPActionOutput(port)]
+    if int(vlan) != 1 and port not in trunk_ports:
+        actions.insert(0, parser.OFPActionPopVlan())
+    yield _flow(FORWARD_TABLE, 2, parser.OFPMatch(vlan_vid=vid, eth_dst=mac), actions)
+
+def unlearnFlow(datapath, vlan, mac, port, vid_mask=0x1fff):
+    """Flow-mod deleting the table 1 entry of a host that left port."""
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    match = parser.OFPMatch(in_port=port, vlan_vid=vlanVid(OF, vlan, vid_mask), eth_src=mac)
+    return parser.OFPFlowMod(datapath, table_id=LEARN_TABLE, command=OF.OFPFC_DELETE_STRICT, priority=1,
+                             out_port=OF.OFPP_ANY, out_group=OF.OFPG_ANY, match=match)
@@ -0,0 +1,54 @@
+VLAN_TAG_802_1Q = 0x8100
+BROADCAST = 'ff:ff:ff:ff:ff:ff'
+# below the learned unicast flows, above the table-miss entry
+FLOOD_PRIORITY = 1
+
+def vlanFloodFlows(datapath, vlans, vid_mask=0x1fff):
+    """Yields (priority, match, actions) flood rules for one datapath.
+
+    vlans is {vlanID: PortSets} as returned by PortSetCache.vlans(dpid).
+    Broadcasts from an access port go untagged to the other access ports
+    and tagged to the trunks; tagged broadcasts from a trunk go as-is to
+    the other trunks and untagged to the access ports. vid_mask lets the
+    DSCP apps cover both the even and odd VID of a VLAN with one rule.
+    Ports listed as both access and trunk are flooded to as trunks.
+    """
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    for vlan, ports in vlans.items():
+        vid = int(vlan) | OF.OFPVID_PRESENT
+        tag = [parser.OFPActionPushVlan(VLAN_TAG_802_1Q), parser.OFPActionSetField(vlan_vid=vid)]
+        access = ports.access - ports.trunk
+        for in_port in ports.access:
+            actions = [parser.OFPActionOutput(p) for p in sorted(access - set([in_port]))]
+            if ports.trunk:
+                actions += tag + [parser.OFPActionOutput(p) for p in sorted(ports.trunk)]
+            match = parser.OFPMatch(in_port=in_port, eth_dst=BROADCAST, vlan_vid=OF.OFPVID_NONE)
+            yield FLOOD_PRIORITY, match, actions
+        for in_port in ports.trunk:
+            actions = [parser.OFPActionOutput(p) for p in sorted(ports.trunk - set([in_port]))]
+            if access:
+                actions += [parser.OFPActionPopVlan()] + [parser.OFPActionOutput(p) for p in sorted(access)]
+            match = parser.OFPMatch(in_port=in_port, eth_dst=BROADCAST, vlan_vid=(vid, vid_mask))
+            yield FLOOD_PRIORITY, match, actions
+
+def portFloodFlows(datapath, vlans, port_vlan, default=1):
+    """Yields (priority, match, actions) flood rules for apps that never tag.
+
+    Like vlanSwitching's packet-in path, a broadcast goes as it came in to
+    the other ports of port_vlan(in_port), whatever its tag; ports of the
+    default VLAN, trunks included, flood to the whole switch. Every port
+    gets one rule, so a trunk shared by VLANs is not overwritten by each.
+    """
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    flood = set()
+    for vlan, ports in vlans.items():
+        for in_port in sorted(ports.all):
+            vlan_of_port = port_vlan(in_port)
+            if vlan_of_port == default:
+                flood.add(in_port)
+            elif vlan_of_port == vlan:
+                actions = [parser.OFPActionOutput(p) for p in sorted(ports.flood(in_port))]
+                yield FLOOD_PRIORITY, parser.OFPMatch(in_port=in_port, eth_dst=BROADCAST), actions
+    for in_port in sorted(flood):
+        actions = [parser.OFPActionOutput(OF.OFPP_FLOOD)]
+        yield FLOOD_PRIORITY, parser.OFPMatch(in_port=in_port, eth_dst=BROADCAST), actions
@@ -0,0 +1,172 @@
+"""Proxy ARP / IPv6 neighbor discovery responder.
+
+Bindings of IP to MAC are learned per VLAN from the ARP and neighbor
+discovery packets that reach the controller. A request for a known
+address is answered by the controller on the port it came in on; only
+misses are flooded. Bindings live in one bounded table, least recently
+learned first, and are not used once older than max_age seconds.
+
+Only broadcasts that reach the controller are answered, with PROACTIVE
+or PIPELINE the switches flood them on their own.
+"""
+import binascii
+import struct
+import time
+from collections import OrderedDict
+
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_IPV6 = 0x86dd
+ETHERTYPES = (ETH_TYPE_ARP, ETH_TYPE_IPV6)
+ARP_REQUEST, ARP_REPLY = 1, 2
+ICMPV6 = 58
+ND_SOLICIT, ND_ADVERT = 135, 136
+ND_SOURCE_LL, ND_TARGET_LL = 1, 2
+IPV6_HLEN = 40
+ETH_ZLEN = 60
+
+_arp = struct.Struct('!HHBBH6s4s6s4s')
+_na = struct.Struct('!BBHI16sBB6s')
+_ipv6 = struct.Struct('!IHBB16s16s')
+_u8 = struct.Struct('!B').unpack_from
+_UNSPECIFIED = b'\x00' * 16
+_ZERO_IP = b'\x00' * 4
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+def mac_bytes(mac):
+    return binascii.unhexlify(mac.replace(':', ''))
+
+class ProxyArp(object):
+
+    def __init__(self, capacity=4096, max_age=300, clock=time.time):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.clock = clock
+        self.bindings = OrderedDict()
+        self.answered = 0
+        self.missed = 0
+
+    def learn(self, vlan, ip, mac):
+        """Binds ip (4 or 16 raw bytes) to mac (6 raw bytes) in vlan."""
+        key = (int(vlan), ip)
+        self.bindings.pop(key, None)
+        self.bindings[key] = (mac, self.clock())
+        while len(self.bindings) > self.capacity:
+            self.bindings.popitem(last=False)
+
+    def lookup(self, vlan, ip):
+        key = (int(vlan), ip)
+        entry = self.bindings.get(key)
+        if entry is None:
+            return None
+        if self.max_age and self.clock() - entry[1] > self.max_age:
+            del self.bindings[key]
+            return None
+        return entry[0]
+
+    def expire(self):
+        if not self.max_age:
+            return
+        deadline = self.clock() - self.max_age
+        while self.bindings:
+            key = next(iter(self.bindings))
+            if self.bindings[key][1] > deadline:
+                break
+            del self.bindings[key]
+
+    def forget(self, stations):
+        """Drops the bindings of (vlan, 'xx:xx:..') stations, e.g. flushed MACs."""
+        gone = set((int(vlan), mac_bytes(mac)) for vlan, mac in stations)
+        if not gone:
+            return
+        for key in [k for k, (mac, _) in self.bindings.items() if (k[0], mac) in gone]:
+            del self.bindings[key]
+
+    def flush(self, vlan=None):
+        if vlan is None:
+            self.bindings.clear()
+            return
+        for key in [k for k in self.bindings if k[0] == int(vlan)]:
+            del self.bindings[key]
+
+    def handle(self, vlan, frame):
+        """Learns from an ARP/ND frame, returns the reply frame or None."""
+        if frame.ethertype == ETH_TYPE_ARP:
+            return self._arp(vlan, frame)
+        if frame.ethertype == ETH_TYPE_IPV6:
+            return self._nd(vlan, frame)
+        return None
+
+    def _reply(self, frame, dst, src, payload):
+        # keep the request's 802.1Q tag so replies to a trunk stay in the VLAN
+        data = dst + src + frame.data[12:frame.l3_offset] + payload
+        return data.ljust(ETH_ZLEN, b'\x00')
+
+    def _arp(self, vlan, frame):
+        data, offset = frame.data, frame.l3_offset
+        if len(data) < offset + _arp.size:
+            return None
+        htype, ptype, hlen, plen, op, sha, spa, tha, tpa = _arp.unpack_from(data, offset)
+        if htype != 1 or ptype != 0x0800 or hlen != 6 or plen != 4:
+            return None
+        if spa != _ZERO_IP:
+            self.learn(vlan, spa, sha)
+        if op != ARP_REQUEST or spa == _ZERO_IP or spa == tpa:
+            # probes and gratuitous ARP only teach us something
+            return None
+        mac = self.lookup(vlan, tpa)
+        if mac is None or mac == sha:
+            self.missed += 1
+            return None
+        self.answered += 1
+        return self._reply(frame, sha, mac, _arp.pack(1, 0x0800, 6, 4, ARP_REPLY, mac, tpa, sha, spa))
+
+    @staticmethod
+    def _option(data, offset, end, kind):
+        while offset + 8 <= end:
+            length = _u8(data, offset + 1)[0] * 8
+            if not length:
+                return None
+            if _u8(data, offset)[0] == kind:
+                return bytes(data[offset + 2:offset + 8])
+            offset += length
+        return None
+
+    def _nd(self, vlan, frame):
+        data, offset = frame.data, frame.l3_offset
+        icmp = offset + IPV6_HLEN
+        if len(data) < icmp + 24 or _u8(data, offset + 6)[0] != ICMPV6:
+            return None
+        kind = _u8(data, icmp)[0]
+        if kind not in (ND_SOLICIT, ND_ADVERT) or _u8(data, offset + 7)[0] != 255:
+            return None
+        src_ip = bytes(data[offset + 8:offset + 24])
+        target = bytes(data[icmp + 8:icmp + 24])
+        end = min(len(data), icmp + struct.unpack_from('!H', data, offset + 4)[0])
+        if kind == ND_ADVERT:
+            mac = self._option(data, icmp + 24, end, ND_TARGET_LL) or bytes(data[6:12])
+            self.learn(vlan, target, mac)
+            return None
+        if src_ip == _UNSPECIFIED:
+            # duplicate address detection, the owner has to answer itself
+            return None
+        src_mac = self._option(data, icmp + 24, end, ND_SOURCE_LL) or bytes(data[6:12])
+        self.learn(vlan, src_ip, src_mac)
+        mac = self.lookup(vlan, target)
+        if mac is None or mac == src_mac:
+            self.missed += 1
+            return None
+        self.answered += 1
+        length = _na.size
+        pseudo = target + src_ip + struct.pack('!IxxxB', length, ICMPV6)
+        # solicited and override flags
+        advert = _na.pack(ND_ADVERT, 0, 0, 0x60000000, target, ND_TARGET_LL, 1, mac)
+        advert = advert[:2] + struct.pack('!H', checksum(pseudo + advert)) + advert[4:]
+        header = _ipv6.pack(0x60000000, length, ICMPV6, 255, target, src_ip)
+        return self._reply(frame, bytes(data[6:12]), mac, header + advert)
@@ -0,0 +1,177 @@
+"""Runtime VLAN membership changes for the switching apps.
+
+A ControlServer listens on a Unix socket for JSON requests, one per line:
+
+    {"op": "add", "kind": "access", "vlan": 10, "dpid": 3, "port": 6}
+    {"op": "remove", "kind": "trunk", "vlan": 20, "dpid": 4, "port": 1}
+    {"op": "move", "vlan": 20, "dpid": 3, "port": 6}
+    {"op": "add_vlan", "vlan": 30}
+    {"op": "remove_vlan", "vlan": 30}
+    {"op": "show"}
+    {"op": "stats"}
+
+and answers each with one JSON line, {"ok": true, ...} or {"ok": false,
+"error": ...}. Changes go through the app's reconfigure(vlan_map,
+trunk_map), which uses diff() to touch only the ports that changed.
+"""
+import copy
+import json
+import os
+
+from ryu.lib import hub
+
+class ReconfigError(ValueError):
+    pass
+
+def _key(map, vlan):
+    # keep the key type of the map, vlanSwitching uses strings
+    for key in map:
+        return type(key)(vlan)
+    return vlan
+
+def applyChange(vlan_map, trunk_map, request):
+    """Returns new (vlan_map, trunk_map) with request applied."""
+    vlan_map, trunk_map = copy.deepcopy(vlan_map), copy.deepcopy(trunk_map)
+    op = request.get('op')
+    try:
+        vlan = _key(vlan_map, int(request['vlan']))
+        if op in ('add', 'remove', 'move'):
+            member = (int(request['port']), int(request['dpid']))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ReconfigError("bad request %r: %s" % (request, e))
+    if op == 'add_vlan':
+        # as vlanConfig: 1 is the default VLAN, 0 and 4095 are reserved
+        if not 2 <= int(vlan) <= 4094:
+            raise ReconfigError("VLAN id out of range: %s" % vlan)
+        if vlan in vlan_map:
+            raise ReconfigError("VLAN %s already exists" % vlan)
+        vlan_map[vlan], trunk_map[vlan] = [], []
+        return vlan_map, trunk_map
+    if vlan not in vlan_map:
+        raise ReconfigError("unknown VLAN %s" % vlan)
+    if op == 'remove_vlan':
+        del vlan_map[vlan]
+        trunk_map.pop(vlan, None)
+    elif op in ('add', 'remove'):
+        kind = request.get('kind')
+        if kind not in ('access', 'trunk'):
+            raise ReconfigError("kind must be access or trunk")
+        ports = (vlan_map if kind == 'access' else trunk_map).setdefault(vlan, [])
+        if op == 'remove':
+            if member not in ports:
+                raise ReconfigError("port %s on %s is not %s in VLAN %s" % (member + (kind, vlan)))
+            ports.remove(member)
+        else:
+            if member in ports:
+                raise ReconfigError("port %s on %s is already %s in VLAN %s" % (member + (kind, vlan)))
+            owner = [v for v, p in vlan_map.items() if member in p]
+            if kind == 'access' and owner:
+                raise ReconfigError("port %s on %s is access in VLAN %s, use move" % (member + (owner[0],)))
+            ports.append(member)
+    elif op == 'move':
+        for ports in vlan_map.values():
+            while member in ports:
+                ports.remove(member)
+        vlan_map[vlan].append(member)
+    else:
+        raise ReconfigError("unknown op %r" % op)
+    return vlan_map, trunk_map
+
+class Change(object):
+    """What a reconfiguration changed on one datapath."""
+    __slots__ = ('ports', 'left', 'vlans_added', 'vlans_removed')
+
+    def __init__(self):
+        self.ports = set()
+        self.left = set()
+        self.vlans_added = set()
+        self.vlans_removed = set()
+
+    def asdict(self):
+        return {'ports': sorted(self.ports), 'left': sorted(self.left),
+                'vlans_added': sorted(self.vlans_added), 'vlans_removed': sorted(self.vlans_removed)}
+
+def diff(old, new):
+    """Compares two PortSetCaches, returns {dpid: Change} for changed datapaths.
+
+    Change.left holds the (vlan, port) memberships that went away, whose
+    learned MACs have to be flushed.
+    """
+    changes = {}
+    for dpid in set(old.dpids()) | set(new.dpids()):
+        before, after = old.vlans(dpid), new.vlans(dpid)
+        change = Change()
+        for vlan in set(before) | set(after):
+            was, now = before.get(vlan), after.get(vlan)
+            was_ports = (was.access, was.trunk) if was else (frozenset(), frozenset())
+            now_ports = (now.access, now.trunk) if now else (frozenset(), frozenset())
+            if was_ports == now_ports:
+                continue
+            change.ports |= (was_ports[0] ^ now_ports[0]) | (was_ports[1] ^ now_ports[1])
+            change.left |= set((vlan, port) for port in (was_ports[0] | was_ports[1]) - (now_ports[0] | now_ports[1]))
+            if was is None: change.vlans_added.add(vlan)
+            if now is None: change.vlans_removed.add(vlan)
+        if change.ports:
+            changes[dpid] = change
+    return changes
+
+def flowDeletes(datapath, ports):
+    """Flow-mods deleting every flow that matches or outputs to one of ports."""
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    for port in sorted(ports):
+        for match, out_port in ((parser.OFPMatch(in_port=port), OF.OFPP_ANY), (parser.OFPMatch(), port)):
+            yield parser.OFPFlowMod(datapath, table_id=OF.OFPTT_ALL, command=OF.OFPFC_DELETE,
+                                    out_port=out_port, out_group=OF.OFPG_ANY, match=match)
+
+def sourceDeletes(datapath, table_id, macs):
+    """Flow-mods deleting the source-learning entries of macs."""
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    for mac in macs:
+        yield parser.OFPFlowMod(datapath, table_id=table_id, command=OF.OFPFC_DELETE,
+                                out_port=OF.OFPP_ANY, out_group=OF.OFPG_ANY, match=parser.OFPMatch(eth_src=mac))
+
+class ControlServer(object):
+    """JSON-lines control socket driving app.reconfigure."""
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = os.path.abspath(path)
+
+    def handle(self, request):
+        app = self.app
+        if request.get('op') == 'show':
+            return {'ok': True, 'vlan_map': dict((str(v), p) for v, p in app.vlan_map.items()),
+                    'trunk_map': dict((str(v), p) for v, p in app.trunk_map.items())}
+        if request.get('op') == 'stats':
+            if getattr(app, 'stats', None) is None:
+                raise ReconfigError("stats collection is off, see COLLECT_STATS")
+            return {'ok': True, 'kbps': dict((str(d), dict((str(v), k) for v, k in vlans.items()))
+                                             for d, vlans in app.stats.summary().items())}
+        vlan_map, trunk_map = applyChange(app.vlan_map, app.trunk_map, request)
+        changes = app.reconfigure(vlan_map, trunk_map)
+        return {'ok': True, 'changes': dict((str(d), c.asdict()) for d, c in changes.items())}
+
+    def _client(self, sock, addr):
+        stream = sock.makefile('rwb')
+        try:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    reply = self.handle(json.loads(line.decode('utf-8')))
+                except ValueError as e:
+                    reply = {'ok': False, 'error': str(e)}
+                except Exception as e:
+                    # a failed reconfigure must not take the connection down with it
+                    self.app.logger.exception("control request %r failed", line)
+                    reply = {'ok': False, 'error': "%s: %s" % (type(e).__name__, e)}
+                stream.write((json.dumps(reply) + '\n').encode('utf-8'))
+                stream.flush()
+        finally:
+            stream.close()
+            sock.close()
+
+    def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        hub.StreamServer((self.path,), self._client).serve_forever()
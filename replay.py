@@ -0,0 +1,128 @@
+#!/usr/bin/python
+"""Replays a packet-in trace into the switching apps and diffs their flow-mods.
+
+Traces come from an app run with VLAN_PACKET_TRACE=<file> or from one of
+the benchmark scenarios. Each variant gets the same packet-ins through
+benchmark's StubDatapath, as fast as possible or at the recorded pace:
+
+    python replay.py capture.pkt
+    python replay.py capture.pkt --variants edgeSwitching addDSCP_switching --speed 1
+    python replay.py --scenario tagged -n 1000 --write tagged.pkt
+
+Flow-mods sent while a switch connects are left out, as in benchmark.py;
+the rest are compared as multisets against the first variant.
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+from timeit import default_timer as timer
+
+from ryu.ofproto import ofproto_v1_3_parser
+
+import benchmark
+import packetTrace
+
+def writeScenario(path, scenario, n, seed=0):
+    """Writes a benchmark scenario as a trace, one packet-in per millisecond."""
+    recorder = packetTrace.TraceRecorder(path, size=1 << 20)
+    OF = benchmark.ofproto_v1_3
+    for i, (dpid, in_port, data) in enumerate(dict(benchmark.SCENARIOS)[scenario](random.Random(seed), n)):
+        recorder.add(i / 1000.0, dpid, in_port, OF.OFP_NO_BUFFER, data)
+    recorder.close()
+    return recorder.recorded
+
+def describe(dpid, msg):
+    """Canonical text of a flow-mod, equal for equal flow-mods of any variant."""
+    # cached instructions repr as what they wrap
+    instructions = ', '.join(repr(inst) for inst in msg.instructions)
+    return 'dpid=%s table=%s priority=%s command=%s idle=%s hard=%s match=%s instructions=[%s]' % (
+        dpid, msg.table_id, msg.priority, msg.command, msg.idle_timeout, msg.hard_timeout,
+        sorted(msg.match.items()), instructions)
+
+def replay(variant, records, speed=0):
+    """Feeds records to a fresh app; speed 1 keeps the recorded pace, 0 does not wait."""
+    app = benchmark.loadApp(variant)
+    datapaths = {}
+    samples = []
+    flow_mods = collections.Counter()
+    first = started = None
+    for record in records:
+        datapath = datapaths.get(record.dpid)
+        if datapath is None:
+            datapath = datapaths[record.dpid] = benchmark.StubDatapath(record.dpid)
+            benchmark.connect(app, datapath)
+            datapath.sent, datapath.writes = [], 0
+        if speed:
+            if first is None:
+                first, started = record.time, timer()
+            delay = (record.time - first) / speed - (timer() - started)
+            if delay > 0:
+                time.sleep(delay)
+        start = timer()
+        benchmark.packetIn(app, datapath, record.in_port, record.data, record.buffer_id)
+        samples.append(timer() - start)
+        for msg in datapath.sent:
+            if isinstance(msg, ofproto_v1_3_parser.OFPFlowMod):
+                flow_mods[describe(datapath.id, msg)] += 1
+        datapath.sent = []
+    samples.sort()
+    busy = sum(samples)
+    return {'variant': variant, 'packet_ins': len(samples),
+            'rate': len(samples) / busy if busy else 0.0,
+            'p50_us': benchmark.percentile(samples, 0.50) * 1e6 if samples else 0.0,
+            'p99_us': benchmark.percentile(samples, 0.99) * 1e6 if samples else 0.0,
+            'flow_mods': sum(flow_mods.values()),
+            'messages': sum(dp.writes for dp in datapaths.values()),
+            'flow_mod_set': flow_mods}
+
+def diff(base, other):
+    """(only in base, only in other) flow-mods, counting repeats."""
+    return base - other, other - base
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', nargs='?', help='packet trace to replay')
+    parser.add_argument('--variants', nargs='+', default=benchmark.VARIANTS)
+    parser.add_argument('--speed', type=float, default=0,
+                        help='1 replays at the recorded pace, 2 twice as fast, 0 as fast as possible')
+    parser.add_argument('--scenario', choices=[name for name, _ in benchmark.SCENARIOS],
+                        help='replay a benchmark scenario instead of a trace')
+    parser.add_argument('-n', type=int, default=1000, help='packet-ins of --scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write', help='write the --scenario trace here and exit')
+    parser.add_argument('--show', type=int, default=10, help='differing flow-mods to print per variant')
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.scenario:
+        path = args.write or args.trace
+        if not path:
+            parser.error('--scenario needs a trace file or --write to record into')
+        print('wrote %d packet-ins to %s' % (writeScenario(path, args.scenario, args.n, args.seed), path))
+        if args.write:
+            return
+    elif not args.trace:
+        parser.error('give a trace file or --scenario')
+    records = list(packetTrace.read(path if args.scenario else args.trace))
+
+    results = [replay(variant, records, args.speed) for variant in args.variants]
+    print('%-18s %9s %10s %9s %9s %9s %9s' % ('variant', 'pkt-ins', 'pkt-in/s', 'p50 us', 'p99 us', 'flowmods', 'messages'))
+    for r in results:
+        print('%-18s %9d %10.0f %9.1f %9.1f %9d %9d' % (r['variant'], r['packet_ins'], r['rate'], r['p50_us'],
+                                                        r['p99_us'], r['flow_mods'], r['messages']))
+    base = results[0]
+    for r in results[1:]:
+        missing, extra = diff(base['flow_mod_set'], r['flow_mod_set'])
+        if not missing and not extra:
+            print('\n%s: same flow-mods as %s' % (r['variant'], base['variant']))
+            continue
+        print('\n%s vs %s: %d only in %s, %d only in %s' % (r['variant'], base['variant'], sum(missing.values()),
+                                                           base['variant'], sum(extra.values()), r['variant']))
+        for sign, mods in (('-', missing), ('+', extra)):
+            for text, count in sorted(mods.items())[:args.show]:
+                print('%s %s%s' % (sign, text, ' x%d' % count if count > 1 else ''))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import collections
+
+from ryu.lib import hub
+
+class ShardPool(object):
+    """Runs handler(ev) for packet-ins on hub threads, in order per datapath.
+
+    Every datapath has its own FIFO and at most one worker on it at a time,
+    so its packet-ins are handled in arrival order and its MAC table and
+    pending flow-mods are only ever touched by that worker. Workers take the
+    datapaths in turn, one packet-in each, so a switch with a long backlog
+    delays the others by a turn instead of by its whole queue.
+
+    A datapath holding queue_size packet-ins drops new ones that carry
+    their frame; those whose buffer_id the switch holds are always queued,
+    dropping them would leave the buffer to time out on the switch.
+    """
+
+    def __init__(self, handler, workers=4, queue_size=1024, logger=None):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.logger = logger
+        self.queues = {}
+        # dpids with a worker on them or waiting in ready for one
+        self.scheduled = set()
+        self.ready = hub.Queue()
+        self.handled = {}
+        self.dropped = {}
+
+    def submit(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        queue = self.queues.get(dpid)
+        if queue is None:
+            queue = self.queues[dpid] = collections.deque()
+        if len(queue) >= self.queue_size and msg.buffer_id == msg.datapath.ofproto.OFP_NO_BUFFER:
+            self.dropped[dpid] = self.dropped.get(dpid, 0) + 1
+            return False
+        queue.append(ev)
+        if dpid not in self.scheduled:
+            self.scheduled.add(dpid)
+            self.ready.put(dpid)
+        return True
+
+    def _worker(self, i):
+        while True:
+            dpid = self.ready.get()
+            queue = self.queues.get(dpid)
+            if queue:
+                try:
+                    self.handler(queue.popleft())
+                except Exception:
+                    if self.logger is not None:
+                        self.logger.exception("packet-in worker %s failed on %s", i, dpid)
+                self.handled[dpid] = self.handled.get(dpid, 0) + 1
+            # forget() may have swapped the queue while the handler ran
+            if self.queues.get(dpid):
+                self.ready.put(dpid)
+            else:
+                self.scheduled.discard(dpid)
+            hub.sleep(0)
+
+    def start(self):
+        return [hub.spawn(self._worker, i) for i in range(self.workers)]
+
+    def forget(self, dpid):
+        """Drops what a disconnected datapath still has queued."""
+        queue = self.queues.pop(dpid, None)
+        if queue:
+            queue.clear()
+
+    def queued(self):
+        return dict((dpid, len(queue)) for dpid, queue in self.queues.items())
@@ -1,4 +1,23 @@
 #!/usr/bin/python
+"""Mininet data center topology for the VLAN switching apps.
+
+    sudo python start.py --aggr 4 --edges 8 --hosts 12 --vlans 10,20,30 \
+        --vlan-bw 1000,2000,500 --config scale.yaml
+
+builds 4 aggregation switches with 8 edge switches each and 12 hosts per
+edge, all hanging off one core bridge, writes the matching VLAN config and
+starts the network. The controller has to load the config before the
+switches connect, so either start it afterwards with
+VLAN_CONFIG=scale.yaml or use --config-only first. Without arguments it
+builds the original two aggregation/edge pairs of four hosts.
+
+Aggregation switch i has dpid 0x10000+i, uplink on port 1 and its edges on
+ports 2 and up. Edge switches are numbered from dpid 3 with the uplink on
+port 1 and hosts on ports 2 and up, as in the apps' built-in maps.
+"""
+import argparse
+import json
+
 from mininet.net import Mininet
 from mininet.util import dumpNodeConnections
 # if import error for OVSBridge, may need to git pull and then ./install.sh -n
@@ -8,56 +27,158 @@ from mininet.link import TCLink,Intf
 from mininet.cli import CLI
 from mininet.topo import Topo
 
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import vlanConfig
+
+AGGR_BASE = 0x10000
+FIRST_EDGE = 3
+
+def assignBlock(vlans, edge, host, hosts):
+    # contiguous runs of ports per VLAN on every edge
+    return vlans[host * len(vlans) // hosts]
+
+def assignRoundRobin(vlans, edge, host, hosts):
+    return vlans[host % len(vlans)]
+
+def assignEdge(vlans, edge, host, hosts):
+    # every host of an edge switch in the same VLAN
+    return vlans[edge % len(vlans)]
+
+ASSIGN = {'block': assignBlock, 'roundrobin': assignRoundRobin, 'edge': assignEdge}
+
+class ScaleLayout(object):
+    """Switches, port numbers and VLAN membership of a generated topology."""
+
+    def __init__(self, aggr=2, edges=1, hosts=4, vlans=(10, 20), assign='block'):
+        self.aggr, self.edges, self.hosts = aggr, edges, hosts
+        self.vlans = list(vlans)
+        self.assign = ASSIGN[assign] if not callable(assign) else assign
+
+    def aggrDpid(self, i):
+        return AGGR_BASE + i
+
+    def edgeDpid(self, i, j):
+        return FIRST_EDGE + (i - 1) * self.edges + (j - 1)
+
+    def members(self):
+        """Yields (aggr, edge, host, port, vlan), all indexes 1-based."""
+        for i in range(1, self.aggr + 1):
+            for j in range(1, self.edges + 1):
+                edge = (i - 1) * self.edges + (j - 1)
+                for k in range(1, self.hosts + 1):
+                    yield i, j, edge * self.hosts + k, k + 1, self.assign(self.vlans, edge, k - 1, self.hosts)
+
+    def config(self, bandwidths):
+        """vlanConfig-format dict, bandwidths is {vlan: kbps}."""
+        vlans = dict((vlan, {'bandwidth': bandwidths[vlan], 'access': {}, 'trunk': {}, 'meters': {}})
+                     for vlan in self.vlans)
+        for i, j, host, port, vlan in self.members():
+            spec = vlans[vlan]
+            edge, aggr = self.edgeDpid(i, j), self.aggrDpid(i)
+            spec['access'].setdefault(edge, []).append(port)
+            spec['trunk'][edge] = [1]
+            spec['meters'][edge] = self.vlans.index(vlan) + 1
+            trunk = spec['trunk'].setdefault(aggr, [1])
+            if j + 1 not in trunk:
+                trunk.append(j + 1)
+        for vlan in list(vlans):
+            if not vlans[vlan]['access']:
+                del vlans[vlan]
+        return {'vlans': vlans}
+
 class CustomTopo(Topo):
     "Simple Data Center Topology"
 
-    "linkopts - (1:core, 2:ToR, 3: access) parameters"
-    "fanout - number of child switch per parent switch"
-    def __init__(self, linkopts1={}, linkopts2={}, access_fanout=2, host_fanout=2, **opts):
+    "linkopts - (0: core, 1: aggr-edge, 2: host) parameters"
+    "access_fanout - number of edge switches per aggregation switch"
+    def __init__(self, linkopts1={}, linkopts2={}, access_fanout=1, host_fanout=2,
+                 aggr_fanout=2, linkopts0={}, vlans=(10, 20), assign='block', **opts):
         # Initialize topology and default options
         Topo.__init__(self, **opts)
 
-        # Add your logic here ...
         self.access_fanout = access_fanout
         self.host_fanout = host_fanout
+        self.layout = ScaleLayout(aggr_fanout, access_fanout, host_fanout, vlans, assign)
 
-        # Create counters for Agg,Edge,Host
-        counterHost = 0
-
-        # Create Aggregate Switch
         c2 = self.addSwitch('dumb',dpid="0000000001",cls=UserSwitch)
         bridge = self.addSwitch('bridge',dpid="0000000002",cls=OVSBridge)
-        # Create Tree of Switches and Hosts
-
-        aggr1 = self.addSwitch('aggr1',dpid="000033",cls=UserSwitch)
-        self.addLink(aggr1,bridge)
-        edgeSwitch = self.addSwitch('edge1',dpid="0003",cls=UserSwitch)
-        self.addLink(aggr1,edgeSwitch,**linkopts1)
-        for j in range(1,host_fanout+1):
-                    counterHost += 1
-                    host = self.addHost('h%s'%counterHost)
-                    self.addLink(host,edgeSwitch,**linkopts2)
-
-        aggr2 = self.addSwitch('aggr2',dpid="000055",cls=UserSwitch)
-        self.addLink(aggr2,bridge)
-        edgeSwitch = self.addSwitch('edge2',dpid="0005",cls=UserSwitch)
-        self.addLink(aggr2,edgeSwitch,**linkopts1)
-        for j in range(1,host_fanout+1):
-                    counterHost += 1
-                    host = self.addHost('h%s'%counterHost)
-                    self.addLink(host,edgeSwitch,**linkopts2)
-                    
+
+        edges = {}
+        for i in range(1, aggr_fanout + 1):
+            aggr = self.addSwitch('aggr%s' % i, dpid='%x' % self.layout.aggrDpid(i), cls=UserSwitch)
+            self.addLink(aggr, bridge, port1=1, **linkopts0)
+            for j in range(1, access_fanout + 1):
+                n = len(edges) + 1
+                edge = edges[(i, j)] = self.addSwitch('edge%s' % n, dpid='%x' % self.layout.edgeDpid(i, j),
+                                                      cls=UserSwitch)
+                self.addLink(aggr, edge, port1=j + 1, port2=1, **linkopts1)
+        for i, j, host, port, vlan in self.layout.members():
+            self.addLink(self.addHost('h%s' % host), edges[(i, j)], port2=port, **linkopts2)
+
+    def vlanConfig(self, bandwidths):
+        return self.layout.config(bandwidths)
+
 topos = { 'custom': ( lambda: CustomTopo() ) }
 
-setLogLevel('info')
-linkopts1 = {'bw':50}
-linkopts2 = {'bw':30}
+def writeConfig(path, raw):
+    # checked with the controller's own loader before anything is written
+    vlanConfig.VlanConfig(raw)
+    with open(path, 'w') as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise vlanConfig.ConfigError("PyYAML is needed to write %s" % path)
+            yaml.safe_dump(raw, f, default_flow_style=None)
+        else:
+            json.dump(raw, f, indent=1, sort_keys=True)
+
+def intList(text):
+    return [int(x) for x in text.split(',') if x]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mininet topology for the VLAN switching apps")
+    parser.add_argument('--aggr', type=int, default=2, help="aggregation switches")
+    parser.add_argument('--edges', type=int, default=1, help="edge switches per aggregation switch")
+    parser.add_argument('--hosts', type=int, default=4, help="hosts per edge switch")
+    parser.add_argument('--core-bw', type=float, help="aggregation-core link bandwidth, Mbit/s")
+    parser.add_argument('--edge-bw', type=float, default=50, help="aggregation-edge link bandwidth, Mbit/s")
+    parser.add_argument('--host-bw', type=float, default=30, help="host link bandwidth, Mbit/s")
+    parser.add_argument('--vlans', type=intList, default=[10, 20], help="comma separated VLAN ids")
+    parser.add_argument('--vlan-bw', type=intList, default=[1000, 2000],
+                        help="meter rate of each VLAN in kbps, one value applies to all")
+    parser.add_argument('--assign', choices=sorted(ASSIGN), default='block',
+                        help="how hosts of an edge are spread over the VLANs")
+    parser.add_argument('--config', help="write the matching VLAN config here (.yaml or .json)")
+    parser.add_argument('--config-only', action='store_true', help="write --config and exit")
+    parser.add_argument('--controller', default='127.0.0.1')
+    args = parser.parse_args(argv)
+    if len(args.vlan_bw) == 1:
+        args.vlan_bw *= len(args.vlans)
+    if len(args.vlan_bw) != len(args.vlans):
+        parser.error("--vlan-bw needs one rate or one per VLAN")
+    if args.config_only and not args.config:
+        parser.error("--config-only needs --config")
 
-topo = CustomTopo(linkopts1, linkopts2, access_fanout=2,host_fanout=4)
+    linkopts0 = {'bw': args.core_bw} if args.core_bw else {}
+    linkopts1 = {'bw': args.edge_bw}
+    linkopts2 = {'bw': args.host_bw}
+    topo = CustomTopo(linkopts1, linkopts2, access_fanout=args.edges, host_fanout=args.hosts,
+                      aggr_fanout=args.aggr, linkopts0=linkopts0, vlans=args.vlans, assign=args.assign)
+    if args.config:
+        writeConfig(args.config, topo.vlanConfig(dict(zip(args.vlans, args.vlan_bw))))
+        if args.config_only:
+            return
 
-net = Mininet(topo=topo, link=TCLink,
-   controller=lambda name: RemoteController( name, ip='127.0.0.1' ),listenPort=6633)
-net.start()
-#net.pingAll(timeout=0.1)
-CLI(net)
+    setLogLevel('info')
+    net = Mininet(topo=topo, link=TCLink,
+       controller=lambda name: RemoteController( name, ip=args.controller ),listenPort=6633)
+    net.start()
+    #net.pingAll(timeout=0.1)
+    CLI(net)
+    net.stop()
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""Background flow, port and meter statistics per datapath and VLAN.
+
+Every datapath is polled for each kind of stats on its own schedule,
+offset by dpid so thousands of switches are not asked in the same tick,
+and at most `burst` requests go out per tick. A kind is not requested
+again while a datapath still owes the previous reply. Multipart replies
+are collected by xid until the last part and then handed to the
+collector's thread, which works through them in chunks so the packet-in
+path keeps running.
+
+Counters are turned into deltas and summed per (dpid, vlan). Only the
+last `ring_size` deltas of each series are kept, in a Ring. The previous
+counters are kept for flows present in the last reply, ports and meters.
+"""
+import heapq
+import time
+from array import array
+from collections import deque
+
+from ryu.lib import hub
+
+import flowTracker
+
+KINDS = ('flow', 'port', 'meter')
+VID_PRESENT = 0x1000
+
+class Ring(object):
+    """Fixed-size ring of (time, seconds, packets, bytes) samples."""
+    __slots__ = ('size', 'data', 'start', 'count')
+    FIELDS = 4
+
+    def __init__(self, size):
+        self.size = size
+        self.data = array('d', [0.0]) * (size * self.FIELDS)
+        self.start = 0
+        self.count = 0
+
+    def append(self, t, seconds, packets, bytes):
+        i = (self.start + self.count) % self.size
+        if self.count == self.size:
+            self.start = (self.start + 1) % self.size
+        else:
+            self.count += 1
+        self.data[i * 4:i * 4 + 4] = array('d', (t, seconds, packets, bytes))
+
+    def __iter__(self):
+        for n in range(self.count):
+            i = (self.start + n) % self.size * 4
+            yield tuple(self.data[i:i + 4])
+
+    def __len__(self):
+        return self.count
+
+    def rate(self):
+        """(packets/s, bytes/s) over the whole ring, None if empty."""
+        seconds = packets = bytes = 0.0
+        for _, s, p, b in self:
+            seconds, packets, bytes = seconds + s, packets + p, bytes + b
+        if not seconds:
+            return None
+        return packets / seconds, bytes / seconds
+
+def matchVlan(dpid, match, port_vlan, vid_vlan):
+    """VLAN of a flow from its vlan_vid or in_port match, None if neither."""
+    vid = match.get('vlan_vid')
+    if isinstance(vid, tuple):
+        vid = vid[0]
+    if vid is not None and vid & VID_PRESENT:
+        return vid_vlan(vid & 0xfff)
+    in_port = match.get('in_port')
+    if in_port is not None:
+        return port_vlan(dpid, in_port)
+    return None
+
+class StatsCollector(object):
+    """Polls flow/port/meter stats and keeps per-(dpid, vlan) delta rings.
+
+    port_vlan(dpid, port), vid_vlan(vid) and meter_vlan(dpid, meter_id)
+    map what a switch reports to the app's VLANs; meter_vlan None skips
+    meter stats.
+    """
+
+    def __init__(self, port_vlan, vid_vlan, meter_vlan=None, intervals=None, ring_size=64,
+                 tick=0.1, burst=50, timeout=30, chunk=500, backlog=1000, clock=time.time, logger=None):
+        self.port_vlan = port_vlan
+        self.vid_vlan = vid_vlan
+        self.meter_vlan = meter_vlan
+        self.intervals = dict(intervals or {'flow': 10, 'port': 5, 'meter': 5})
+        if meter_vlan is None:
+            self.intervals.pop('meter', None)
+        self.ring_size = ring_size
+        self.tick = tick
+        self.burst = burst
+        self.timeout = timeout
+        self.chunk = chunk
+        self.clock = clock
+        self.logger = logger
+        self.datapaths = {}
+        self.schedule = []
+        self.outstanding = {}
+        self.parts = {}
+        self.ready = deque(maxlen=backlog)
+        self.last = {}
+        self.polled = {}
+        self.rings = {}
+        self.sent = self.coalesced = self.dropped = 0
+
+    def add(self, datapath):
+        """Starts polling datapath, each kind at its own offset."""
+        dpid = datapath.id
+        self.datapaths[dpid] = datapath
+        now = self.clock()
+        for kind, interval in self.intervals.items():
+            # spread datapaths over the interval, 0.618.. keeps neighbours apart
+            offset = (dpid * 0.6180339887 + KINDS.index(kind) / 3.0) % 1.0 * interval
+            heapq.heappush(self.schedule, (now + offset, dpid, kind))
+
+    def forget(self, dpid):
+        self.datapaths.pop(dpid, None)
+        for key in [k for k in self.outstanding if k[0] == dpid]:
+            del self.outstanding[key]
+        for key in [k for k in self.parts if k[0] == dpid]:
+            del self.parts[key]
+        for table in (self.last, self.polled):
+            for key in [k for k in table if k[1] == dpid]:
+                del table[key]
+        for key in [k for k in self.rings if k[1] == dpid]:
+            del self.rings[key]
+
+    def request(self, datapath, kind):
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        if kind == 'flow':
+            req = parser.OFPFlowStatsRequest(datapath, 0, OF.OFPTT_ALL, OF.OFPP_ANY, OF.OFPG_ANY,
+                                             0, 0, parser.OFPMatch())
+        elif kind == 'port':
+            req = parser.OFPPortStatsRequest(datapath, 0, OF.OFPP_ANY)
+        else:
+            req = parser.OFPMeterStatsRequest(datapath, 0, OF.OFPM_ALL)
+        datapath.send_msg(req)
+        self.sent += 1
+        return req.xid
+
+    def poll(self):
+        """Sends the requests that are due, at most burst of them."""
+        now, sent = self.clock(), 0
+        while self.schedule and self.schedule[0][0] <= now and sent < self.burst:
+            due, dpid, kind = heapq.heappop(self.schedule)
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            interval = self.intervals[kind]
+            heapq.heappush(self.schedule, (max(due + interval, now), dpid, kind))
+            pending = self.outstanding.get((dpid, kind))
+            if pending is not None and now - pending[1] < self.timeout:
+                self.coalesced += 1
+                continue
+            self.parts.pop((dpid, pending and pending[0]), None)
+            self.outstanding[(dpid, kind)] = (self.request(datapath, kind), now)
+            sent += 1
+        return sent
+
+    def reply(self, kind, msg):
+        """Collects one part of a stats reply, cheap enough for the event loop."""
+        dpid = msg.datapath.id
+        pending = self.outstanding.get((dpid, kind))
+        if pending is None or pending[0] != msg.xid:
+            return
+        key = (dpid, msg.xid)
+        self.parts.setdefault(key, []).extend(msg.body)
+        if msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            return
+        del self.outstanding[(dpid, kind)]
+        if len(self.ready) == self.ready.maxlen:
+            self.dropped += 1
+        self.ready.append((kind, dpid, self.clock(), self.parts.pop(key)))
+
+    def _ring(self, kind, dpid, vlan):
+        ring = self.rings.get((kind, dpid, vlan))
+        if ring is None:
+            ring = self.rings[(kind, dpid, vlan)] = Ring(self.ring_size)
+        return ring
+
+    def _counters(self, kind, dpid, body):
+        # yields (vlan, key, packets, bytes, seconds alive) per stat
+        if kind == 'flow':
+            for stat in body:
+                vlan = matchVlan(dpid, stat.match, self.port_vlan, self.vid_vlan)
+                if vlan is not None:
+                    key = flowTracker.flowKey(stat.table_id, stat.priority, stat.match)
+                    yield vlan, key, stat.packet_count, stat.byte_count, stat.duration_sec + stat.duration_nsec / 1e9
+        elif kind == 'port':
+            for stat in body:
+                yield (self.port_vlan(dpid, stat.port_no), stat.port_no, stat.rx_packets + stat.tx_packets,
+                       stat.rx_bytes + stat.tx_bytes, stat.duration_sec + stat.duration_nsec / 1e9)
+        else:
+            for stat in body:
+                vlan = self.meter_vlan(dpid, stat.meter_id)
+                if vlan is not None:
+                    yield (vlan, stat.meter_id, stat.packet_in_count, stat.byte_in_count,
+                           stat.duration_sec + stat.duration_nsec / 1e9)
+
+    def process(self, kind, dpid, seconds, body):
+        """Turns one complete reply into {vlan: (packets, bytes)} deltas.
+
+        seconds is the time since the previous reply. Counters that went
+        backwards count from zero; a counter seen for the first time only
+        counts if it started within seconds, otherwise its history is unknown.
+        """
+        last = self.last.get((kind, dpid), {})
+        current, totals = {}, {}
+        for vlan, key, packets, bytes, alive in self._counters(kind, dpid, body):
+            current[key] = (packets, bytes, alive)
+            before = last.get(key)
+            if before is not None and packets >= before[0] and alive >= before[2]:
+                packets, bytes = packets - before[0], bytes - before[1]
+            elif before is None and alive > seconds:
+                packets = bytes = 0
+            total = totals.get(vlan, (0, 0))
+            totals[vlan] = (total[0] + packets, total[1] + bytes)
+        self.last[(kind, dpid)] = current
+        return totals
+
+    def record(self, kind, dpid, t, body):
+        since = self.polled.get((kind, dpid))
+        self.polled[(kind, dpid)] = t
+        if since is None:
+            # the first reply only sets the baseline
+            self.process(kind, dpid, 0, body)
+            return
+        for vlan, (packets, bytes) in self.process(kind, dpid, t - since, body).items():
+            self._ring(kind, dpid, vlan).append(t, t - since, packets, bytes)
+
+    def drain(self):
+        processed = 0
+        while self.ready:
+            kind, dpid, t, body = self.ready.popleft()
+            if dpid in self.datapaths:
+                self.record(kind, dpid, t, body)
+            processed += len(body)
+            if processed >= self.chunk:
+                hub.sleep(0)
+                processed = 0
+
+    def series(self, kind, dpid, vlan):
+        ring = self.rings.get((kind, dpid, vlan))
+        return list(ring) if ring is not None else []
+
+    def summary(self):
+        """{dpid: {vlan: {kind: kbps}}} averaged over each ring."""
+        out = {}
+        for (kind, dpid, vlan), ring in self.rings.items():
+            rate = ring.rate()
+            if rate is not None:
+                out.setdefault(dpid, {}).setdefault(vlan, {})[kind] = rate[1] * 8 / 1000.0
+        return out
+
+    def _loop(self):
+        while True:
+            self.poll()
+            self.drain()
+            hub.sleep(self.tick)
+
+    def start(self):
+        return hub.spawn(self._loop)
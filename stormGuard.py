@@ -0,0 +1,96 @@
+import time
+
+ALLOW, DROP, TRIP = 'allow', 'drop', 'trip'
+# the last meter id OpenFlow allows, clear of the apps' per-VLAN meters;
+# tripped ports count down from it, see portMeterId
+MISS_METER = 0xffff0000
+# behind every table the apps use, the table-miss entry continues here
+GUARD_TABLE = 3
+# a tripped port's entry, above the guard table's miss entry
+TRIPPED_PRIORITY = 1
+
+class _Port(object):
+    __slots__ = ('tokens', 'stamp', 'blocked_until', 'allowed', 'dropped', 'trips')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.stamp = now
+        self.blocked_until = 0
+        self.allowed = self.dropped = self.trips = 0
+
+class StormGuard(object):
+    """Per-(dpid, in_port) token bucket in front of the packet-in handler.
+
+    Each port may send `rate` packet-ins per second with bursts up to
+    `burst`. check() returns ALLOW, DROP, or TRIP the first time a port
+    runs dry; the guard then drops the port's packet-ins for `block_time`
+    seconds. On the switch, missMeter caps the packet-ins of the whole
+    switch at `miss_rate`, and trippedFlow moves a tripped port's misses
+    to a meter of its own for `block_time`, so the port neither starves
+    the others of that budget nor loses the flows it already has.
+    """
+
+    def __init__(self, rate=100, burst=200, block_time=10, miss_rate=1000, miss_burst=2000, clock=time.time):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.block_time = block_time
+        self.miss_rate = miss_rate
+        self.miss_burst = miss_burst
+        self.clock = clock
+        self.ports = {}
+        # (dpid, port) whose meter the switch already has
+        self.metered = set()
+
+    def check(self, dpid, port):
+        now = self.clock()
+        state = self.ports.get((dpid, port))
+        if state is None:
+            state = self.ports[(dpid, port)] = _Port(self.burst, now)
+        if now < state.blocked_until:
+            state.dropped += 1
+            return DROP
+        state.tokens = min(self.burst, state.tokens + (now - state.stamp) * self.rate)
+        state.stamp = now
+        if state.tokens >= 1:
+            state.tokens -= 1
+            state.allowed += 1
+            return ALLOW
+        state.blocked_until = now + self.block_time
+        state.dropped += 1
+        state.trips += 1
+        return TRIP
+
+    def stats(self):
+        """Returns {(dpid, port): (allowed, dropped, trips, blocked)} counters."""
+        now = self.clock()
+        return dict((key, (s.allowed, s.dropped, s.trips, now < s.blocked_until))
+                    for key, s in self.ports.items())
+
+    def forget(self, dpid):
+        self.metered = set(key for key in self.metered if key[0] != dpid)
+
+def portMeterId(port):
+    """Meter of a tripped port's packet-ins."""
+    return MISS_METER - port
+
+def missMeter(datapath, rate, burst, command=None, meter_id=MISS_METER):
+    """Meter-mod for MISS_METER, dropping packet-ins above rate per second.
+
+    Only the table-miss entries use it: traffic that matches a learned
+    flow is never metered, whatever port it comes from. Tripped ports get
+    one with their own meter_id.
+    """
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    bands = [parser.OFPMeterBandDrop(rate=int(rate), burst_size=int(burst))]
+    return parser.OFPMeterMod(datapath=datapath, command=OF.OFPMC_ADD if command is None else command,
+                              flags=OF.OFPMF_PKTPS | OF.OFPMF_BURST, meter_id=meter_id, bands=bands)
+
+def trippedFlow(datapath, port, seconds):
+    """Flow-mod sending port's misses to the controller through its own meter
+    for the given seconds, ahead of the guard table's shared MISS_METER."""
+    OF, parser = datapath.ofproto, datapath.ofproto_parser
+    actions = [parser.OFPActionOutput(OF.OFPP_CONTROLLER, OF.OFPCML_NO_BUFFER)]
+    inst = [parser.OFPInstructionActions(OF.OFPIT_APPLY_ACTIONS, actions),
+            parser.OFPInstructionMeter(portMeterId(port))]
+    return parser.OFPFlowMod(datapath=datapath, table_id=GUARD_TABLE, priority=TRIPPED_PRIORITY,
+                             hard_timeout=int(seconds), match=parser.OFPMatch(in_port=port), instructions=inst)
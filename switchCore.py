@@ -0,0 +1,727 @@
+"""Packet-in pipeline and RyuApp base shared by the switching apps.
+
+vlanSwitching, newSwitching, edgeSwitching and addDSCP_switching are
+subclasses of SwitchCore. Every packet-in goes through the same stages:
+
+    classify  the packet's VLAN, from the port map or the VID on the wire
+    learn     MAC learning, trace, metrics, pipeline and proxy ARP hooks
+    decide    known destination or flood, and the tagging of the flow
+    emit      the learned flow(s) and the packet-out
+
+classify, decide and the learned-flow part of emit are plugins, picked by
+the app's PLUGINS at load time. Each app's plugins reproduce its original
+handler byte for byte, quirks included, so replay.py finds no difference.
+
+Switch setup, reconfiguration, the stats/state handlers and the feature
+switches live here too; an app only brings its maps, its PLUGINS and the
+meter hooks, then calls setup().
+"""
+import os
+
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
+from ryu.controller.handler import set_ev_cls
+from ryu.lib import hub
+
+import fastParser
+import macTable
+import vlanTables
+import proactiveFlows
+import pipeline
+import flowBatcher
+import stormGuard
+import flowCache
+import floodGroups
+import flowTracker
+import eventLog
+import vlanConfig
+import reconfig
+import meterManager
+import switchMetrics
+import warmRestart
+import vlanTranslation
+import proxyArp
+import statsCollector
+import packetTrace
+import shardPool
+
+class PacketIn(object):
+    """What the stages know about one packet-in."""
+    __slots__ = ('msg', 'datapath', 'dpid', 'in_port', 'frame', 'port_vlan', 'vlan', 'default', 'ports')
+
+    def __init__(self, msg, frame):
+        self.msg = msg
+        self.datapath = msg.datapath
+        self.dpid = msg.datapath.id
+        self.in_port = msg.match['in_port']
+        self.frame = frame
+
+# classify: sets port_vlan, vlan and default (vlan is the catch-all VLAN 1)
+
+class PortVlan(object):
+    """VLAN of the in_port as a string key (vlanSwitching).
+
+    Tags are ignored, except in pipeline mode where trunks carry tagged
+    traffic and the learned entries have to match its VID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def classify(self, pkt):
+        pkt.port_vlan = vlan = str(self.app.getVlan(pkt.in_port, pkt.dpid))
+        if pkt.frame.vid is not None and self.app.PIPELINE:
+            vlan = self.app.vidVlan(pkt.frame.vid)
+        pkt.vlan = vlan
+        pkt.default = vlan == '1'
+
+class WireVlan(object):
+    """VLAN of the in_port, or of the VID if the frame is tagged."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def classify(self, pkt):
+        pkt.port_vlan = vlan = self.app.getVlan(pkt.in_port, pkt.dpid)
+        vid = pkt.frame.vid
+        if vid is not None:
+            vlan = self.app.vidVlan(vid)
+        pkt.vlan = vlan
+        pkt.default = vlan == 1
+
+# decide: FlowCache tag_op of a flow to a learned out_port
+
+class NoTagging(object):
+    """Frames leave as they came in (vlanSwitching)."""
+    TAGS = False
+
+    def __init__(self, app):
+        pass
+
+    def tagOp(self, pkt, out_port):
+        return 0
+
+class PushPop(object):
+    """Tag towards trunks, strip whatever came in tagged (newSwitching, addDSCP_switching)."""
+    TAGS = True
+
+    def __init__(self, app):
+        self.app = app
+
+    def tagOp(self, pkt, out_port):
+        if pkt.default:
+            tag_op = 0
+        elif out_port in pkt.ports.trunk:
+            tag_op = flowCache.PUSH
+        elif out_port in pkt.ports.access:
+            tag_op = 0
+        else:
+            tag_op = flowCache.NO_OUTPUT
+        if pkt.frame.vid is not None:
+            tag_op |= flowCache.POP
+        return tag_op
+
+class EdgeTagging(object):
+    """Tags stay on from trunk to trunk, never stacked (edgeSwitching)."""
+    TAGS = True
+
+    def __init__(self, app):
+        self.app = app
+
+    def tagOp(self, pkt, out_port):
+        tagged = pkt.frame.vid is not None
+        if pkt.default:
+            tag_op = 0
+        elif out_port in pkt.ports.trunk:
+            tag_op = 0 if tagged else flowCache.PUSH
+        elif out_port in pkt.ports.access:
+            tag_op = 0
+        else:
+            tag_op = flowCache.NO_OUTPUT
+        if tagged and out_port not in pkt.ports.trunk:
+            tag_op |= flowCache.POP
+        return tag_op
+
+# emit: installs the flow(s) for a learned destination, True if the
+# flow-mod took the switch's buffer and no packet-out is needed
+
+class LearnedFlows(object):
+    """in_port/eth_dst flow in table 0, no VID match (vlanSwitching)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def match(self, pkt, parser):
+        return parser.OFPMatch(in_port=pkt.in_port, eth_dst=pkt.frame.dst)
+
+    def install(self, pkt, out_port, learned):
+        datapath, msg = pkt.datapath, pkt.msg
+        match = self.match(pkt, datapath.ofproto_parser)
+        if msg.buffer_id != datapath.ofproto.OFP_NO_BUFFER:
+            self.app.add_flow(datapath, 1, match, learned.actions, write=learned.write, buffer_id=msg.buffer_id,
+                              instructions=learned.instructions(), station=(pkt.vlan, pkt.frame.dst))
+            return True
+        self.app.add_flow(datapath, 1, match, learned.actions, write=learned.write,
+                          instructions=learned.instructions(), station=(pkt.vlan, pkt.frame.dst))
+        return False
+
+class TaggedFlows(LearnedFlows):
+    """Tagged packets match their VLAN id as vlan_vid (newSwitching)."""
+
+    def match(self, pkt, parser):
+        if pkt.frame.vid is not None:
+            return parser.OFPMatch(in_port=pkt.in_port, eth_dst=pkt.frame.dst, vlan_vid=pkt.vlan)
+        return parser.OFPMatch(in_port=pkt.in_port, eth_dst=pkt.frame.dst)
+
+class DscpFlows(LearnedFlows):
+    """Flows in the app's forward_table, metered by the in_port's VLAN (addDSCP_switching).
+
+    As the original handler, only a flow-mod that takes the switch's
+    buffer carries the meter.
+    """
+
+    def match(self, pkt, parser):
+        if pkt.frame.vid is not None:
+            vid_table = self.app.vid_table
+            vid = pkt.vlan if vid_table is None else vid_table.match(pkt.datapath.ofproto, pkt.vlan)
+            return parser.OFPMatch(in_port=pkt.in_port, eth_dst=pkt.frame.dst, vlan_vid=vid)
+        return parser.OFPMatch(in_port=pkt.in_port, eth_dst=pkt.frame.dst)
+
+    def install(self, pkt, out_port, learned):
+        app, datapath, msg = self.app, pkt.datapath, pkt.msg
+        match = self.match(pkt, datapath.ofproto_parser)
+        if msg.buffer_id != datapath.ofproto.OFP_NO_BUFFER:
+            meter_id = 0 if pkt.port_vlan == 1 else app.getMeterID(pkt.port_vlan, pkt.dpid)
+            app.add_flow(datapath, 1, match, learned.actions, write=learned.write, buffer_id=msg.buffer_id,
+                         meter_id=meter_id, instructions=learned.instructions(meter_id),
+                         station=(pkt.vlan, pkt.frame.dst), table_id=app.forward_table)
+            return True
+        app.add_flow(datapath, 1, match, learned.actions, write=learned.write, instructions=learned.instructions(),
+                     station=(pkt.vlan, pkt.frame.dst), table_id=app.forward_table)
+        return False
+
+class EdgeFlows(LearnedFlows):
+    """Metered flows for untagged traffic, per-VID flows for tagged (edgeSwitching).
+
+    Without a VID table a tagged packet also gets a flow for the VID of
+    its remarked class, and towards a trunk one that retags remarked
+    traffic with it.
+    """
+
+    def install(self, pkt, out_port, learned):
+        app, datapath, msg = self.app, pkt.datapath, pkt.msg
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        in_port, dst, vlan = pkt.in_port, pkt.frame.dst, pkt.vlan
+        if pkt.frame.vid is None:
+            meter_id = app.getMeterID(vlan, pkt.dpid)
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
+        elif app.vid_table is not None:
+            # every class of the VLAN, the trunk it came in on already retagged it
+            meter_id = 0
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst, vlan_vid=app.vid_table.match(OF, vlan))
+        else:
+            meter_id = 0
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst, vlan_vid=(vlan + 1))
+            if out_port in pkt.ports.trunk:
+                match = parser.OFPMatch(in_port=in_port, eth_dst=dst, vlan_vid=vlan, ip_dscp=0x08, eth_type=0x0800)
+                field = parser.OFPMatchField.make(OF.OXM_OF_VLAN_VID, (vlan + 1))
+                app.add_flow(datapath, 2, match, learned.actions + [parser.OFPActionSetField(field)],
+                             write=learned.write, buffer_id=msg.buffer_id, meter_id=meter_id, station=(vlan, dst))
+            app.add_flow(datapath, 1, match, learned.actions, write=learned.write, meter_id=meter_id,
+                         instructions=learned.instructions(meter_id), station=(vlan, dst))
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst, vlan_vid=vlan)
+        buffer_id = msg.buffer_id if msg.buffer_id != OF.OFP_NO_BUFFER else None
+        app.add_flow(datapath, 1, match, learned.actions, write=learned.write, buffer_id=buffer_id,
+                     meter_id=meter_id, instructions=learned.instructions(meter_id), station=(vlan, dst),
+                     table_id=app.forward_table)
+        return buffer_id is not None
+
+class SwitchCore(app_manager.RyuApp):
+    """What the switching apps share; PLUGINS is (classify, decide, emit).
+
+    An app sets vlan_map and trunk_map (and its meter maps) in __init__ and
+    then calls setup(), which loads CONFIG and enables the features below.
+    Apps with a meter per VLAN set METERS and override getMeterID,
+    installMeters and meterVlan; VLAN_KEY is the type of their VLAN keys.
+    """
+    PLUGINS = (WireVlan, PushPop, TaggedFlows)
+    VLAN_KEY = int
+    METERS = False
+    # group flow-mods per datapath and commit them with a barrier
+    FLOW_BATCHING = False
+    # pre-install per-VLAN flood rules when a switch connects
+    PROACTIVE = False
+    # VLAN classify -> MAC learn -> forward tables, supersedes PROACTIVE
+    PIPELINE = False
+    # rate limit packet-ins per (dpid, in_port), meter the table-miss entries
+    # and give each tripped port a meter of its own on the switch
+    STORM_GUARD = False
+    # flood through one OpenFlow ALL group per VLAN instead of output lists
+    FLOOD_GROUPS = False
+    # YAML/JSON VLAN config replacing the app's maps, see vlanConfig
+    CONFIG = os.environ.get('VLAN_CONFIG')
+    # Unix socket taking runtime VLAN membership changes, see reconfig
+    CONTROL_SOCKET = os.environ.get('VLAN_CONTROL_SOCKET')
+    # poll meter stats and rebalance meter rates max-min fairly (METERS apps)
+    DYNAMIC_METERS = False
+    # seconds between the dynamic meters' stats polls and rebalances
+    METER_INTERVAL = 10
+    # kbps a port can carry; lets the dynamic meters also take what the
+    # busiest port leaves idle, 0 keeps them within their nominal rates
+    LINK_CAPACITY = 0
+    # idle/hard timeout in seconds of learned flows, 0 never expires them;
+    # the config's idle_timeout/hard_timeout override them per VLAN
+    IDLE_TIMEOUT = 0
+    HARD_TIMEOUT = 0
+    # queue log records for a background writer, keeping 1 in LOG_SAMPLE
+    # of each message below WARNING
+    ASYNC_LOG = False
+    LOG_SAMPLE = 1
+    # JSON-lines trace of packet-ins, flow-mods and floods, see eventLog
+    TRACE = os.environ.get('VLAN_TRACE')
+    # binary record of every packet-in for replay.py, see packetTrace
+    PACKET_TRACE = os.environ.get('VLAN_PACKET_TRACE')
+    # port of a local Prometheus endpoint for counters and latency, 0 disables
+    METRICS_PORT = int(os.environ.get('VLAN_METRICS_PORT') or 0)
+    # handle packet-ins on this many hub threads with one ordered queue per
+    # datapath, so a busy switch does not hold up the others; 0 runs them inline
+    WORKERS = 0
+    # directory of persisted MAC tables; switches that reconnect are
+    # reconciled against their own flows and meters, see warmRestart
+    STATE_DIR = os.environ.get('VLAN_STATE_DIR')
+    # answer ARP requests and neighbor solicitations for known hosts from
+    # the controller instead of flooding them, see proxyArp
+    PROXY_ARP = False
+    # poll flow and port stats, and meter stats with METERS, into
+    # per-(dpid, VLAN) delta rings, see statsCollector
+    COLLECT_STATS = False
+    # tag each DSCP class with a VID from vlanTranslation.CLASSES, retagging
+    # once per trunk port and matching all classes of a VLAN with one masked
+    # rule, instead of the even/odd VID flows per learned destination (METERS apps)
+    TRANSLATION = False
+
+    def __init__(self, *args, **kwargs):
+        super(SwitchCore, self).__init__(*args, **kwargs)
+        self.classifier, self.decider, self.emitter = [plugin(self) for plugin in self.PLUGINS]
+        self.mac_to_port = macTable.MacTable()
+        # background loops of the enabled features; they never return, so
+        # stop() kills them instead of joining them with self.threads
+        self.helpers = []
+        # learned flows go in forward_table, behind the translate table if there is one
+        self.vid_table = None
+        self.vid_mask = 0x1fff
+        self.forward_table = 0
+        self.meter_manager = None
+
+    def setup(self):
+        # enable the features switched on above, once the app has its maps
+        self.timeouts = {}
+        self.config = None
+        if self.CONFIG: self.loadConfig(self.CONFIG)
+        self.flood_groups = floodGroups.FloodGroups(self.decider.TAGS) if self.FLOOD_GROUPS else None
+        self.proxy_arp = proxyArp.ProxyArp() if self.PROXY_ARP else None
+        # the config's tables are keyed by int, apps with other keys compile their own
+        self.compileMaps(self.config if self.VLAN_KEY is int else None)
+        self.flow_batcher = None
+        if self.FLOW_BATCHING: self.enableFlowBatching()
+        self.storm_guard = stormGuard.StormGuard() if self.STORM_GUARD else None
+        if self.ASYNC_LOG:
+            self.helpers.append(eventLog.install(self.logger,self.LOG_SAMPLE).start())
+        self.trace = None
+        if self.TRACE:
+            self.trace = eventLog.EventTrace(self.TRACE)
+            self.helpers.append(self.trace.start())
+        self.recorder = None
+        if self.PACKET_TRACE: self.enableRecorder(self.PACKET_TRACE)
+        self.flow_tracker = None
+        if self.IDLE_TIMEOUT or self.HARD_TIMEOUT or self.timeouts:
+            self.flow_tracker = flowTracker.FlowTracker(self.IDLE_TIMEOUT,self.HARD_TIMEOUT,self.timeouts)
+        self.metrics = None
+        if self.METRICS_PORT: self.enableMetrics(self.METRICS_PORT)
+        self.workers = None
+        if self.WORKERS: self.enableWorkers(self.WORKERS)
+        self.snapshot = None
+        self.reconciler = None
+        if self.STATE_DIR: self.enableWarmRestart(self.STATE_DIR)
+        self.stats = None
+        if self.COLLECT_STATS: self.enableStats()
+        if self.TRANSLATION: self.enableTranslation()
+        if self.DYNAMIC_METERS: self.enableDynamicMeters(self.METER_INTERVAL)
+        self.datapaths = {}
+        if self.CONTROL_SOCKET:
+            self.helpers.append(hub.spawn(reconfig.ControlServer(self,self.CONTROL_SOCKET).serve))
+
+    def getVlan(self,port,dpid):
+        return self.vlan_index.get(port,dpid)
+
+    def vidVlan(self,vid):
+        # odd VIDs carry the remarked traffic of the even VLAN below
+        return self.vid_table.vlan(vid) if self.vid_table is not None else vid-vid%2
+
+    def getMeterID(self,vlanID,dpid):
+        return 0
+
+    def meterVlan(self,dpid,meter_id):
+        return None
+
+    def loadConfig(self, path):
+        self.config = vlanConfig.load(path)
+        key = self.VLAN_KEY
+        self.timeouts = dict((key(v),t) for v,t in self.config.timeouts.items())
+        self.vlan_map = dict((key(v),ports) for v,ports in self.config.vlan_map.items())
+        self.trunk_map = dict((key(v),ports) for v,ports in self.config.trunk_map.items())
+
+    def compileMaps(self, tables=None):
+        # rebuild lookup tables, call again whenever vlan_map/trunk_map change
+        if tables is not None:
+            self.vlan_index,self.port_sets = tables.vlan_index,tables.port_sets
+        else:
+            self.vlan_index = vlanTables.VlanIndex(self.vlan_map)
+            self.port_sets = vlanTables.PortSetCache(self.vlan_map,self.trunk_map)
+        self.flow_cache = flowCache.FlowCache()
+        if self.flood_groups is not None: self.flood_groups.resync(self.port_sets)
+        for (dpid,port),vlans in self.vlan_index.conflicts.items():
+            self.logger.warning("port %s on %s is assigned to VLANs %s, using %s",
+                                port, dpid, sorted(vlans), self.vlan_index.get(port,dpid))
+
+    def reconfigure(self, vlan_map, trunk_map):
+        # swap in new maps, then only touch the ports whose membership changed
+        old,old_vlans=self.port_sets,set(self.vlan_map)
+        # refuse VLAN ids the VID table cannot encode before changing anything
+        if self.vid_table is not None: self.vid_table=vlanTranslation.VidTable(vlan_map)
+        self.vlan_map,self.trunk_map=vlan_map,trunk_map
+        self.config=None
+        self.compileMaps()
+        # meters follow whole VLANs, they are installed for every VLAN on connect
+        for datapath in self.datapaths.values():
+            self.removeMeters(datapath,old_vlans-set(vlan_map))
+            self.installMeters(datapath,set(vlan_map)-old_vlans)
+        changes=reconfig.diff(old,self.port_sets)
+        for dpid,change in changes.items():
+            flushed=[]
+            for vlan,port in change.left: flushed+=self.mac_to_port.flush(dpid,vlan,port)
+            if self.proxy_arp is not None: self.proxy_arp.forget((vlan,mac) for _,vlan,mac in flushed)
+            self.logger.info("reconfigured %s P: %s, flushed %s MACs", dpid, sorted(change.ports), len(flushed))
+            datapath=self.datapaths.get(dpid)
+            if datapath is None: continue
+            if self.flow_batcher is not None: self.flow_batcher.flush(dpid)
+            for mod in reconfig.flowDeletes(datapath,change.ports): datapath.send_msg(mod)
+            if self.PIPELINE:
+                macs=[mac for _,_,mac in flushed]
+                for mod in reconfig.sourceDeletes(datapath,pipeline.LEARN_TABLE,macs): datapath.send_msg(mod)
+                self.installPipeline(datapath)
+            elif self.PROACTIVE: self.installVlanFloods(datapath)
+            if self.vid_table is not None: self.installTranslation(datapath)
+        return changes
+
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        datapath = ev.msg.datapath
+        # replayed by the reconciler once the switch has reported its state
+        if self.reconciler is not None and self.reconciler.reconcile(ev): return
+        OF,parser=datapath.ofproto,datapath.ofproto_parser
+        # install table-miss flow entry
+        actions = [parser.OFPActionOutput(OF.OFPP_CONTROLLER,OF.OFPCML_NO_BUFFER)]
+        if self.storm_guard is not None and not self.PIPELINE:
+            # a miss table of its own leaves room for the entries of tripped ports
+            self.add_flow(datapath, 0, parser.OFPMatch(), [], table_id=self.forward_table, goto=stormGuard.GUARD_TABLE)
+            self.add_flow(datapath, 0, parser.OFPMatch(), actions, table_id=stormGuard.GUARD_TABLE, meter_id=self.missMeter(datapath))
+        else:
+            self.add_flow(datapath, 0, parser.OFPMatch(), actions, table_id=self.forward_table, meter_id=self.missMeter(datapath))
+        self.datapaths[datapath.id]=datapath
+        if self.stats is not None: self.stats.add(datapath)
+        if self.flood_groups is not None: self.flood_groups.install(datapath,self.port_sets.vlans(datapath.id))
+        if self.PROACTIVE and not self.PIPELINE: self.installVlanFloods(datapath)
+        self.installMeters(datapath,self.vlan_map)
+        if self.PIPELINE: self.installPipeline(datapath)
+        if self.vid_table is not None: self.installTranslation(datapath)
+
+    def missMeter(self, datapath):
+        # the storm guard meters what misses the learned flows, not the ports
+        if self.storm_guard is None: return 0
+        command=self.meterCommand(datapath,stormGuard.MISS_METER)
+        datapath.send_msg(stormGuard.missMeter(datapath,self.storm_guard.miss_rate,self.storm_guard.miss_burst,command))
+        return stormGuard.MISS_METER
+
+    def meterPort(self, datapath, port):
+        # move a tripped port's misses off the switch-wide MISS_METER until block_time is up
+        guard,meter_id=self.storm_guard,stormGuard.portMeterId(port)
+        if (datapath.id,port) in guard.metered: command=datapath.ofproto.OFPMC_MODIFY
+        else: command=self.meterCommand(datapath,meter_id)
+        datapath.send_msg(stormGuard.missMeter(datapath,guard.rate,guard.burst,command,meter_id))
+        guard.metered.add((datapath.id,port))
+        datapath.send_msg(stormGuard.trippedFlow(datapath,port,guard.block_time))
+
+    def installMeters(self, datapath, vlans):
+        # apps with METERS install the meters of these VLANs here
+        pass
+
+    def removeMeters(self, datapath, vlans):
+        OF,parser=datapath.ofproto,datapath.ofproto_parser
+        for vlan in vlans:
+            meter_id=self.getMeterID(vlan,datapath.id)
+            if not meter_id: continue
+            datapath.send_msg(parser.OFPMeterMod(datapath=datapath,command=OF.OFPMC_DELETE,meter_id=meter_id))
+            if self.meter_manager is not None: self.meter_manager.remove(datapath.id,meter_id)
+
+    def meterCommand(self,dp,meter_id):
+        # a reconnecting switch may still have the meter, re-adding it fails
+        if self.reconciler is not None and self.reconciler.meterExists(dp.id,meter_id): return dp.ofproto.OFPMC_MODIFY
+        return dp.ofproto.OFPMC_ADD
+
+    def installVlanFloods(self, datapath):
+        vlans=self.port_sets.vlans(datapath.id)
+        if self.decider.TAGS:
+            flows=proactiveFlows.vlanFloodFlows(datapath,vlans,vid_mask=self.vid_mask)
+        else:
+            # the packet-in path's VLAN of each port, trunks fall to the default VLAN
+            flows=proactiveFlows.portFloodFlows(datapath,vlans,lambda port: self.VLAN_KEY(self.getVlan(port,datapath.id)),
+                                                default=self.VLAN_KEY(1))
+        for priority,match,actions in flows:
+            self.add_flow(datapath, priority, match, actions, table_id=self.forward_table)
+
+    def installPipeline(self, datapath):
+        vlans=self.port_sets.vlans(datapath.id)
+        meters=dict((vlan,self.getMeterID(vlan,datapath.id)) for vlan in vlans)
+        miss_meter=stormGuard.MISS_METER if self.storm_guard is not None else 0
+        for flow in pipeline.baseFlows(datapath,vlans,vid_mask=self.vid_mask,meters=meters,miss_meter=miss_meter):
+            self.addPipelineFlow(datapath,flow)
+
+    def installTranslation(self, datapath):
+        vlans=self.port_sets.vlans(datapath.id)
+        goto=pipeline.LEARN_TABLE if self.PIPELINE else vlanTranslation.NEXT_TABLE
+        for flow in self.vid_table.rewriteFlows(datapath,vlans,goto): self.addPipelineFlow(datapath,flow)
+        if not self.PIPELINE:
+            for flow in self.vid_table.baseFlows(datapath): self.addPipelineFlow(datapath,flow)
+
+    def pipelineLearn(self, datapath, vlan, src, in_port, moved=None):
+        trunk_ports=self.port_sets.get(vlan,datapath.id).trunk
+        if moved is not None:
+            # the old port's learn entry would keep the host from punting if it moves back
+            if self.flow_batcher is not None: self.flow_batcher.flush(datapath.id)
+            datapath.send_msg(pipeline.unlearnFlow(datapath,vlan,src,moved,vid_mask=self.vid_mask))
+        for flow in pipeline.learnFlows(datapath,vlan,src,in_port,trunk_ports,vid_mask=self.vid_mask):
+            self.addPipelineFlow(datapath,flow,station=(vlan,src))
+
+    def addPipelineFlow(self, datapath, flow, station=None):
+        self.add_flow(datapath, flow.priority, flow.match, flow.actions,
+                      table_id=flow.table_id, goto=flow.goto,station=station,meter_id=flow.meter_id)
+
+    def add_flow(self, datapath, priority, match, actions, write=None,buffer_id=None,meter_id=None,table_id=0,goto=None,instructions=None,station=None):
+        OF,parser=datapath.ofproto,datapath.ofproto_parser
+        inst=instructions
+        if inst is None:
+            inst=[]
+            if len(actions)>0: inst.append(parser.OFPInstructionActions(OF.OFPIT_APPLY_ACTIONS,actions))
+            if write is not None:inst.append(parser.OFPInstructionActions(OF.OFPIT_WRITE_ACTIONS,write))
+            if (meter_id is not None) and (meter_id != 0) : inst.append(parser.OFPInstructionMeter(meter_id))
+            if goto is not None: inst.append(parser.OFPInstructionGotoTable(goto))
+        if self.reconciler is not None and self.reconciler.installed(datapath,table_id,priority,match,inst): return
+        timeouts={}
+        if station is not None and self.flow_tracker is not None:
+            timeouts=self.flow_tracker.add(datapath,table_id,priority,match,*station)
+        if buffer_id:
+            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id, table_id=table_id,
+                        priority=priority, match=match,instructions=inst,**timeouts)
+        else:
+            mod = parser.OFPFlowMod(datapath=datapath, priority=priority, table_id=table_id,
+                                    match=match, instructions=inst,**timeouts)
+        self.logger.debug("flow_mod match: %s action: %s", match, inst)
+        if self.trace is not None: self.trace.emit('flow_mod',datapath.id,table_id,priority)
+        if self.metrics is not None: self.metrics.inc('flow_mod',datapath.id)
+        if self.flow_batcher is not None: self.flow_batcher.add(datapath,mod)
+        else: datapath.send_msg(mod)
+
+    def enableTranslation(self):
+        self.vid_table = vlanTranslation.VidTable(self.vlan_map)
+        self.vid_mask = self.vid_table.mask
+        # the pipeline has its own tables, otherwise learned flows move behind the translate table
+        if not self.PIPELINE: self.forward_table = vlanTranslation.NEXT_TABLE
+
+    def enableDynamicMeters(self, interval=10):
+        self.meter_manager = meterManager.MeterManager(interval,burst=10,link_capacity=self.LINK_CAPACITY or None,
+                                                       logger=self.logger)
+        self.helpers.append(self.meter_manager.start())
+
+    def enableStats(self, ring_size=64):
+        self.stats = statsCollector.StatsCollector(lambda dpid,port: self.getVlan(port,dpid),self.vidVlan,
+                                                   self.meterVlan if self.METERS else None,
+                                                   ring_size=ring_size,logger=self.logger)
+        self.helpers.append(self.stats.start())
+
+    def enableWarmRestart(self, path, interval=5):
+        self.snapshot = warmRestart.MacSnapshot(path)
+        self.logger.info("restored %s MAC entries from %s", self.snapshot.restore(self.mac_to_port), path)
+        self.helpers.append(self.snapshot.start(self.mac_to_port,interval))
+        # the storm guard's miss meter survives a reconnect like the VLAN meters
+        self.reconciler = warmRestart.Reconciler(self.switch_features_handler,meters=self.METERS or self.storm_guard is not None,
+                                                 logger=self.logger)
+
+    def proxyReply(self, datapath, in_port, vlan, frame):
+        reply=self.proxy_arp.handle(vlan,frame)
+        if reply is None: return False
+        OF,parser=datapath.ofproto,datapath.ofproto_parser
+        datapath.send_msg(parser.OFPPacketOut(datapath=datapath,in_port=OF.OFPP_CONTROLLER,buffer_id=OF.OFP_NO_BUFFER,
+                                              actions=[parser.OFPActionOutput(in_port)],data=reply))
+        return True
+
+    def enableFlowBatching(self, max_batch=64, max_delay=0.01):
+        self.flow_batcher = flowBatcher.FlowBatcher(max_batch,max_delay,logger=self.logger)
+        self.helpers.append(self.flow_batcher.start())
+
+    def enableMetrics(self, port=None):
+        self.metrics = switchMetrics.Metrics()
+        self.metrics.gauge('mac_entries',lambda: dict((dpid,len(t)) for dpid,t in self.mac_to_port.tables.items()))
+        if self.flow_tracker is not None:
+            self.metrics.gauge('learned_flows',lambda: dict((dpid,self.flow_tracker.occupancy(dpid)) for dpid in self.flow_tracker.flows))
+        if self.storm_guard is not None:
+            for i,name in enumerate(('storm_allowed','storm_dropped','storm_trips','storm_blocked')):
+                self.metrics.gauge(name,lambda i=i: dict((key,int(s[i])) for key,s in self.storm_guard.stats().items()))
+        if port: self.helpers.append(hub.spawn(switchMetrics.serve,self.metrics,port))
+
+    def enableWorkers(self, count):
+        self.workers = shardPool.ShardPool(self.handlePacketIn,count,logger=self.logger)
+        if self.metrics is not None:
+            self.metrics.gauge('packet_in_queued',self.workers.queued)
+            self.metrics.gauge('packet_in_shed',lambda: dict(self.workers.dropped))
+        self.helpers.extend(self.workers.start())
+
+    def enableRecorder(self, path):
+        self.recorder = packetTrace.TraceRecorder(path)
+        self.helpers.append(self.recorder.start())
+
+    def stop(self):
+        for thread in self.helpers: hub.kill(thread)
+        self.helpers = []
+        super(SwitchCore, self).stop()
+
+    def close(self):
+        # what the killed loops would have written out next
+        if self.flow_batcher is not None: self.flow_batcher.flush()
+        if self.trace is not None: self.trace.flush()
+        if self.snapshot is not None: self.snapshot.save(self.mac_to_port)
+        if self.recorder is not None: self.recorder.close()
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def _barrier_reply_handler(self, ev):
+        if self.flow_batcher is not None: self.flow_batcher.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def _meter_stats_reply_handler(self, ev):
+        if self.meter_manager is not None: self.meter_manager.meterStats(ev.msg)
+        if self.stats is not None: self.stats.reply('meter',ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def _port_stats_reply_handler(self, ev):
+        if self.meter_manager is not None: self.meter_manager.portStats(ev.msg)
+        if self.stats is not None: self.stats.reply('port',ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        if self.reconciler is not None: self.reconciler.flowStats(ev.msg)
+        if self.stats is not None: self.stats.reply('flow',ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterConfigStatsReply, MAIN_DISPATCHER)
+    def _meter_config_reply_handler(self, ev):
+        if self.reconciler is not None: self.reconciler.meterConfig(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def _state_change_handler(self, ev):
+        if ev.datapath.id is None: return
+        self.datapaths.pop(ev.datapath.id,None)
+        if self.flow_batcher is not None: self.flow_batcher.discard(ev.datapath.id)
+        if self.flood_groups is not None: self.flood_groups.forget(ev.datapath.id)
+        if self.flow_tracker is not None: self.flow_tracker.forget(ev.datapath.id)
+        if self.reconciler is not None: self.reconciler.forget(ev.datapath.id)
+        if self.stats is not None: self.stats.forget(ev.datapath.id)
+        if self.meter_manager is not None: self.meter_manager.forget(ev.datapath.id)
+        if self.storm_guard is not None: self.storm_guard.forget(ev.datapath.id)
+        if self.workers is not None: self.workers.forget(ev.datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    def _port_status_handler(self, ev):
+        self.flow_cache.invalidate(ev.msg.datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        # drop a station from the MAC table once none of its flows is left
+        if self.flow_tracker is None: return
+        station=self.flow_tracker.removed(ev.msg)
+        if station is not None: self.mac_to_port.forget(ev.msg.datapath.id,*station)
+
+    def guardPacketIn(self, msg):
+        datapath,in_port=msg.datapath,msg.match['in_port']
+        verdict=self.storm_guard.check(datapath.id,in_port)
+        if verdict is stormGuard.TRIP:
+            self.logger.warning("packet-in storm on %s P: %s, dropping its packet-ins for %ss",
+                                datapath.id, in_port, self.storm_guard.block_time)
+            # the learn table has no priority to spare below its learned entries
+            if not self.PIPELINE: self.meterPort(datapath,in_port)
+        return verdict is stormGuard.ALLOW
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    def _packet_in_handler(self, ev):
+        if self.recorder is not None: self.recorder.record(ev.msg)
+        if self.workers is not None: self.workers.submit(ev)
+        else: self.handlePacketIn(ev)
+
+    @switchMetrics.timed('packet_in')
+    def handlePacketIn(self, ev):
+        msg = ev.msg
+        if msg.msg_len < msg.total_len:
+            self.logger.debug("packet truncated: only %s of %s bytes",msg.msg_len, msg.total_len)
+        if self.storm_guard is not None and not self.guardPacketIn(msg): return
+        frame = fastParser.parse(msg.data)
+        if frame is None: return
+        pkt = PacketIn(msg,frame)
+        self.classifier.classify(pkt)
+        outcome = self.learn(pkt)
+        if outcome is None:
+            out_port = self.mac_to_port.lookup(pkt.dpid,pkt.vlan,frame.dst)
+            if out_port is None:
+                self.packetOut(pkt,self.floodActions(pkt))
+                outcome = switchMetrics.FLOOD
+            else:
+                learned = self.flow_cache.get(pkt.datapath,pkt.vlan,out_port,self.decider.tagOp(pkt,out_port))
+                # the flow-mod releases the packet if the switch buffered it
+                if self.emitter.install(pkt,out_port,learned):
+                    outcome = switchMetrics.BUFFERED
+                else:
+                    self.packetOut(pkt,learned.out)
+                    outcome = switchMetrics.LEARNED
+        if self.metrics is not None: self.metrics.packets[pkt.dpid][pkt.vlan][outcome] += 1
+
+    def learn(self, pkt):
+        # the outcome if the packet is fully handled here, None to forward it
+        dpid,vlan,src,in_port = pkt.dpid,pkt.vlan,pkt.frame.src,pkt.in_port
+        self.logger.debug("packet in %s src: %s dst: %s P: %s V: %s", dpid, src, pkt.frame.dst,in_port, vlan)
+        pkt.ports = None if pkt.default else self.port_sets.get(vlan,dpid)
+        moved = self.mac_to_port.learn(dpid,vlan,src,in_port)
+        if moved is not None:
+            self.logger.info("station %s moved on %s V: %s from P: %s to P: %s", src, dpid, vlan, moved, in_port)
+        if self.trace is not None:
+            self.trace.emit('packet_in',dpid,in_port,vlan,src,pkt.frame.dst)
+            if moved is not None: self.trace.emit('move',dpid,vlan,src,moved,in_port)
+        if self.PIPELINE:
+            self.pipelineLearn(pkt.datapath,vlan,src,in_port,moved)
+            return switchMetrics.PIPELINE
+        if self.proxy_arp is not None and pkt.frame.ethertype in proxyArp.ETHERTYPES:
+            if self.proxyReply(pkt.datapath,in_port,vlan,pkt.frame): return switchMetrics.PROXY
+        return None
+
+    def floodActions(self, pkt):
+        parser = pkt.datapath.ofproto_parser
+        if pkt.default:
+            return [parser.OFPActionOutput(pkt.datapath.ofproto.OFPP_FLOOD)]
+        if self.trace is not None: self.trace.emit('flood',pkt.dpid,pkt.vlan,pkt.in_port)
+        group=self.flood_groups and self.flood_groups.action(pkt.datapath,pkt.vlan,pkt.frame.vid is not None)
+        if group is not None: return [group]
+        return [parser.OFPActionOutput(x) for x in pkt.ports.flood(pkt.in_port)]
+
+    def packetOut(self, pkt, actions):
+        msg,datapath = pkt.msg,pkt.datapath
+        OF = datapath.ofproto
+        data = msg.data if msg.buffer_id == OF.OFP_NO_BUFFER else None
+        datapath.send_msg(datapath.ofproto_parser.OFPPacketOut(datapath=datapath,in_port=pkt.in_port,
+                                                               buffer_id=msg.buffer_id,actions=actions,data=data))
@@ -0,0 +1,166 @@
+import functools
+from timeit import default_timer as clock
+
+from ryu.lib import hub
+
+PREFIX = 'vlan_switch'
+# what became of a packet-in, a slot each in the per-(dpid, VLAN) counts
+PIPELINE, PROXY, FLOOD, LEARNED, BUFFERED = range(5)
+OUTCOMES = 5
+# the counters render() derives from the outcome counts
+DERIVED = (('packet_in', (PIPELINE, PROXY, FLOOD, LEARNED, BUFFERED)),
+           ('proxy_reply', (PROXY,)),
+           ('flood', (FLOOD,)),
+           ('learned', (LEARNED, BUFFERED)),
+           ('packet_out', (FLOOD, LEARNED)))
+# time 1 in SAMPLE packet-ins
+SAMPLE = 16
+
+class Histogram(object):
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are integer nanoseconds. Each power of two is split into 8
+    buckets, so a bucket's width is at most 1/8 of its lower bound and
+    recording is a bit_length and a dict update.
+    """
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+
+    @staticmethod
+    def index(value):
+        e = value.bit_length() - 4
+        return value if e <= 0 else (e << 3) + (value >> e)
+
+    @staticmethod
+    def upper(index):
+        # exclusive upper bound of a bucket, in nanoseconds
+        if index < 16:
+            return index + 1
+        e = (index >> 3) - 1
+        return (index - (e << 3) + 1) << e
+
+    def record(self, value):
+        i = self.index(value)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p):
+        rank, seen = p * self.count, 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return self.upper(i)
+        return 0
+
+class _Vlans(dict):
+    def __missing__(self, vlan):
+        counts = self[vlan] = [0] * OUTCOMES
+        return counts
+
+class _Datapaths(dict):
+    def __missing__(self, dpid):
+        vlans = self[dpid] = _Vlans()
+        return vlans
+
+class Metrics(object):
+    """Per-dpid/VLAN counters, per-dpid latency histograms and gauges.
+
+    The packet-in handler bumps one slot per packet-in,
+    packets[dpid][vlan][outcome] += 1, with slots created on first use;
+    inc() is for the rarer events.
+    """
+
+    def __init__(self, sample=SAMPLE):
+        self.packets = _Datapaths()
+        self.counters = {}
+        self.latency = {}
+        self.gauges = {}
+        self.sample = self.countdown = sample
+
+    def inc(self, name, dpid, vlan=None, n=1):
+        key = (name, dpid, vlan)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, dpid, seconds):
+        key = (name, dpid)
+        hist = self.latency.get(key)
+        if hist is None:
+            hist = self.latency[key] = Histogram()
+        hist.record(int(seconds * 1e9))
+
+    def gauge(self, name, fn):
+        """Registers fn() -> {dpid: value} or {(dpid, port): value}, read at scrape time."""
+        self.gauges[name] = fn
+
+    def render(self):
+        """Prometheus text exposition of everything collected."""
+        lines = []
+        by_name = {}
+        for (name, dpid, vlan), value in self.counters.items():
+            by_name.setdefault(name, []).append((dpid, vlan, value))
+        for dpid, vlans in list(self.packets.items()):
+            for vlan, counts in list(vlans.items()):
+                for name, slots in DERIVED:
+                    value = sum(counts[i] for i in slots)
+                    if value:
+                        by_name.setdefault(name, []).append((dpid, vlan, value))
+        for name in sorted(by_name):
+            lines.append('# TYPE %s_%s_total counter' % (PREFIX, name))
+            for dpid, vlan, value in sorted(by_name[name], key=lambda c: (c[0], str(c[1]))):
+                labels = 'dpid="%s"' % dpid if vlan is None else 'dpid="%s",vlan="%s"' % (dpid, vlan)
+                lines.append('%s_%s_total{%s} %d' % (PREFIX, name, labels, value))
+        for name in sorted(set(n for n, _ in self.latency)):
+            metric = '%s_%s_seconds' % (PREFIX, name)
+            lines.append('# TYPE %s histogram' % metric)
+            for dpid in sorted(d for n, d in self.latency if n == name):
+                hist, seen = self.latency[(name, dpid)], 0
+                for i in sorted(hist.counts):
+                    seen += hist.counts[i]
+                    lines.append('%s_bucket{dpid="%s",le="%.9g"} %d' % (metric, dpid, hist.upper(i) / 1e9, seen))
+                lines.append('%s_bucket{dpid="%s",le="+Inf"} %d' % (metric, dpid, hist.count))
+                lines.append('%s_sum{dpid="%s"} %.9f' % (metric, dpid, hist.total / 1e9))
+                lines.append('%s_count{dpid="%s"} %d' % (metric, dpid, hist.count))
+        for name in sorted(self.gauges):
+            lines.append('# TYPE %s_%s gauge' % (PREFIX, name))
+            for key, value in sorted(self.gauges[name]().items()):
+                labels = 'dpid="%s",port="%s"' % key if isinstance(key, tuple) else 'dpid="%s"' % key
+                lines.append('%s_%s{%s} %s' % (PREFIX, name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+def timed(name):
+    """Decorates a handler(self, ev) to record the latency of 1 in
+    self.metrics.sample calls in self.metrics."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, ev):
+            metrics = self.metrics
+            if metrics is None:
+                return handler(self, ev)
+            metrics.countdown -= 1
+            if metrics.countdown:
+                return handler(self, ev)
+            metrics.countdown = metrics.sample
+            start = clock()
+            try:
+                return handler(self, ev)
+            finally:
+                metrics.observe(name, ev.msg.datapath.id, clock() - start)
+        return wrapper
+    return decorator
+
+def serve(metrics, port, host='127.0.0.1'):
+    """Serves metrics.render() over HTTP for Prometheus to scrape."""
+    def application(environ, start_response):
+        if environ.get('PATH_INFO', '/') not in ('/', '/metrics'):
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'not found\n']
+        body = metrics.render().encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+    hub.WSGIServer((host, port), application).serve_forever()
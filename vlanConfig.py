@@ -0,0 +1,131 @@
+"""Declarative VLAN/trunk/meter configuration for the switching apps.
+
+A config is a YAML (needs PyYAML) or JSON file such as:
+
+    vlans:
+      10:
+        bandwidth: 1000          # kbps, rate of the VLAN's DSCP remark meter
+        access: {1: [1, 2], 3: [2, 3, 4], 4: [5]}    # dpid: [ports]
+        trunk: {1: [1, 2], 2: [1, 2], 3: [1], 4: [1]}
+        meters: {1: 1, 3: 1, 4: 1}                   # dpid: meter id
+        idle_timeout: 60         # seconds, optional, for learned flows
+        hard_timeout: 600
+
+load() validates it and compiles it once into the tables the packet-in
+path uses. The compiled form is pickled next to the config, keyed by a
+hash of the file, so restarting with an unchanged config skips both.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import vlanTables
+
+# bump when the compiled layout changes so stale caches are ignored
+FORMAT = 2
+CACHE_DIR = '.vlan_config_cache'
+
+class ConfigError(ValueError):
+    pass
+
+def _int(value, what, low=1, high=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ConfigError("%s must be an integer, got %r" % (what, value))
+    if number < low or (high is not None and number > high):
+        raise ConfigError("%s out of range: %s" % (what, number))
+    return number
+
+class VlanConfig(object):
+    """Validated config plus its compiled lookup tables.
+
+    vlan_map and trunk_map use the apps' {vlanID:[(port,dpid),...]}
+    format, meter_map is {(vlanID,dpid): meterID}, bw {vlanID: kbps} and
+    timeouts {vlanID: (idle, hard)} with None for unset values.
+    """
+
+    def __init__(self, raw):
+        if not isinstance(raw, dict) or not isinstance(raw.get('vlans'), dict):
+            raise ConfigError("config needs a 'vlans' mapping")
+        self.vlan_map, self.trunk_map = {}, {}
+        self.meter_map, self.bw = {}, {}
+        self.timeouts = {}
+        owner = {}
+        for key, spec in raw['vlans'].items():
+            vlan = _int(key, "VLAN id", 2, 4094)
+            spec = spec or {}
+            unknown = set(spec) - set(['bandwidth', 'access', 'trunk', 'meters',
+                                       'idle_timeout', 'hard_timeout'])
+            if unknown:
+                raise ConfigError("VLAN %s: unknown keys %s" % (vlan, sorted(unknown)))
+            for name, target in (('access', self.vlan_map), ('trunk', self.trunk_map)):
+                ports = target.setdefault(vlan, [])
+                for dpid, plist in (spec.get(name) or {}).items():
+                    dpid = _int(dpid, "VLAN %s %s dpid" % (vlan, name))
+                    for port in plist:
+                        port = _int(port, "VLAN %s %s port on %s" % (vlan, name, dpid))
+                        if name == 'access':
+                            if owner.setdefault((dpid, port), vlan) != vlan:
+                                raise ConfigError("port %s on %s is access in VLANs %s and %s"
+                                                  % (port, dpid, owner[(dpid, port)], vlan))
+                        ports.append((port, dpid))
+            if 'bandwidth' in spec:
+                self.bw[vlan] = _int(spec['bandwidth'], "VLAN %s bandwidth" % vlan)
+            for dpid, meter in (spec.get('meters') or {}).items():
+                self.meter_map[(vlan, _int(dpid, "VLAN %s meter dpid" % vlan))] = \
+                    _int(meter, "VLAN %s meter id" % vlan, 1, 0xffff0000)
+            if 'idle_timeout' in spec or 'hard_timeout' in spec:
+                self.timeouts[vlan] = tuple(None if spec.get(name) is None else
+                                            _int(spec[name], "VLAN %s %s" % (vlan, name), 0, 0xffff)
+                                            for name in ('idle_timeout', 'hard_timeout'))
+            if spec.get('meters') and vlan not in self.bw:
+                raise ConfigError("VLAN %s has meters but no bandwidth" % vlan)
+        self.compile()
+
+    def compile(self):
+        self.vlan_index = vlanTables.VlanIndex(self.vlan_map)
+        self.port_sets = vlanTables.PortSetCache(self.vlan_map, self.trunk_map)
+
+    def metersByDpid(self):
+        """meter_map as {dpid: {vlanID: meterID}}."""
+        meters = {}
+        for (vlan, dpid), meter in self.meter_map.items():
+            meters.setdefault(dpid, {})[vlan] = meter
+        return meters
+
+def parse(text, path=''):
+    if path.endswith(('.yaml', '.yml')):
+        if yaml is None:
+            raise ConfigError("PyYAML is needed to read %s" % path)
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+def load(path, cache=True):
+    with open(path, 'rb') as f:
+        text = f.read()
+    digest = hashlib.sha1(text).hexdigest()
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR,
+                              '%s-%s.pickle' % (digest, FORMAT))
+    if cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass
+    config = VlanConfig(parse(text.decode('utf-8'), path))
+    if cache:
+        try:
+            if not os.path.isdir(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path))
+            with open(cache_path, 'wb') as f:
+                pickle.dump(config, f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError):
+            pass
+    return config
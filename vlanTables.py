@@ -0,0 +1,76 @@
+class VlanIndex(object):
+    """(dpid, port) -> VLAN hash index compiled from a vlan_map.
+
+    vlan_map has the apps' format {vlanID:[(port1,dpid1),(port2,dpid2),...]}.
+    Ports listed under more than one VLAN keep the first VLAN seen in map
+    order (what the old linear getVlan scan returned) and are reported in
+    `conflicts` as {(dpid,port): set(vlanIDs)}.
+    """
+
+    def __init__(self, vlan_map, default=1):
+        self.default = default
+        self.compile(vlan_map)
+
+    def compile(self, vlan_map):
+        index, conflicts = {}, {}
+        for vlan, ports in vlan_map.items():
+            for (port, dpid) in ports:
+                key = (dpid, port)
+                if key not in index:
+                    index[key] = vlan
+                elif index[key] != vlan:
+                    conflicts.setdefault(key, set([index[key]])).add(vlan)
+        self._index = index
+        self.conflicts = conflicts
+
+    def get(self, port, dpid):
+        return self._index.get((dpid, port), self.default)
+
+    def __len__(self):
+        return len(self._index)
+
+class PortSets(object):
+    """Frozen access/trunk ports of one VLAN on one datapath."""
+    __slots__ = ('access', 'trunk', 'all')
+
+    def __init__(self, access=(), trunk=()):
+        self.access = frozenset(access)
+        self.trunk = frozenset(trunk)
+        self.all = self.access | self.trunk
+
+    def flood(self, in_port):
+        return self.all - frozenset((in_port,))
+
+NO_PORTS = PortSets()
+
+class PortSetCache(object):
+    """Per-(dpid, vlan) PortSets precompiled from vlan_map and trunk_map.
+
+    The apps call compile() again from compileMaps whenever the maps
+    change; VLANs with no ports on a datapath map to NO_PORTS.
+    """
+
+    def __init__(self, vlan_map, trunk_map):
+        self.compile(vlan_map, trunk_map)
+
+    def compile(self, vlan_map, trunk_map):
+        access, trunk = {}, {}
+        for map, ports in ((vlan_map, access), (trunk_map, trunk)):
+            for vlan, members in map.items():
+                for (port, dpid) in members:
+                    ports.setdefault((dpid, vlan), []).append(port)
+        self._sets = dict((key, PortSets(access.get(key, ()), trunk.get(key, ())))
+                          for key in set(access) | set(trunk))
+        self._by_dpid = {}
+        for (dpid, vlan), sets in self._sets.items():
+            self._by_dpid.setdefault(dpid, {})[vlan] = sets
+
+    def get(self, vlan, dpid):
+        return self._sets.get((dpid, vlan), NO_PORTS)
+
+    def vlans(self, dpid):
+        """Returns {vlan: PortSets} for every VLAN with ports on dpid."""
+        return self._by_dpid.get(dpid, {})
+
+    def dpids(self):
+        return list(self._by_dpid)
@@ -0,0 +1,96 @@
+"""(VLAN, traffic class) to trunk VID translation for the DSCP apps.
+
+A VLAN's meter remarks the DSCP of traffic above its rate, and each
+traffic class travels the trunks with its own VID so switches further up
+can tell them apart. CLASSES is the table: class c is traffic with DSCP
+dscp (None for whatever is not remarked) and is tagged with VLAN id plus
+offset. The offsets of a VLAN form an aligned block of VIDs, so one
+masked vlan_vid match covers every class of it, and the VIDs are only
+rewritten where traffic enters a trunk port, once per port and class
+instead of once per learned destination.
+
+Outside pipeline mode the rewrites live in TRANSLATE_TABLE in front of
+the learned flows, which move to NEXT_TABLE.
+"""
+from pipeline import PipelineFlow
+
+TRANSLATE_TABLE = 0
+NEXT_TABLE = 1
+REWRITE_PRIORITY = 2
+IPV4 = 0x0800
+
+# (name, dscp, VID offset), class 0 has to be the VLAN id itself
+CLASSES = (('in_profile', None, 0),
+           ('remarked', 0x08, 1))
+
+class TranslationError(ValueError):
+    pass
+
+class VidTable(object):
+    """Wire VIDs of each VLAN and traffic class."""
+
+    def __init__(self, vlans, classes=CLASSES):
+        if not classes or classes[0][2] != 0:
+            raise TranslationError("class 0 must have VID offset 0")
+        self.classes = list(classes)
+        self.block = 1 << max(c[2] for c in classes).bit_length()
+        self.mask = 0x1fff & ~(self.block - 1)
+        self.vlans = set()
+        self.owner = {}
+        for vlan in vlans:
+            self.add(vlan)
+
+    def add(self, vlan):
+        vlan = int(vlan)
+        if vlan == 1:
+            return
+        if vlan & (self.block - 1):
+            raise TranslationError("VLAN %s is not a multiple of %s, its classes would share VIDs"
+                                   % (vlan, self.block))
+        # VID 4095 is reserved
+        if vlan + self.block - 1 > 4094:
+            raise TranslationError("VLAN %s needs VIDs up to %s, past 4094" % (vlan, vlan + self.block - 1))
+        for name, dscp, offset in self.classes:
+            self.owner[vlan + offset] = vlan
+        self.vlans.add(vlan)
+
+    def remove(self, vlan):
+        vlan = int(vlan)
+        self.vlans.discard(vlan)
+        for name, dscp, offset in self.classes:
+            self.owner.pop(vlan + offset, None)
+
+    def vid(self, vlan, cls=0):
+        return int(vlan) + self.classes[cls][2]
+
+    def vlan(self, vid):
+        """VLAN a tagged frame's VID belongs to, the VID itself if unknown."""
+        return self.owner.get(vid, vid)
+
+    def match(self, OF, vlan):
+        """vlan_vid match value covering every class of vlan."""
+        return (int(vlan) | OF.OFPVID_PRESENT, self.mask)
+
+    def rewriteFlows(self, datapath, vlans, goto=NEXT_TABLE):
+        """Yields PipelineFlows retagging remarked traffic entering trunks.
+
+        vlans is {vlanID: PortSets} as returned by PortSetCache.vlans(dpid).
+        Traffic still carrying the class 0 VID but a remarked DSCP gets the
+        VID of its class; everything else is left as it is.
+        """
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        for vlan, ports in sorted(vlans.items()):
+            if int(vlan) not in self.vlans:
+                continue
+            for port in sorted(ports.trunk):
+                for cls, (name, dscp, offset) in enumerate(self.classes):
+                    if dscp is None:
+                        continue
+                    match = parser.OFPMatch(in_port=port, vlan_vid=self.vid(vlan) | OF.OFPVID_PRESENT,
+                                            eth_type=IPV4, ip_dscp=dscp)
+                    actions = [parser.OFPActionSetField(vlan_vid=self.vid(vlan, cls) | OF.OFPVID_PRESENT)]
+                    yield PipelineFlow(TRANSLATE_TABLE, REWRITE_PRIORITY, match, actions, goto, 0)
+
+    def baseFlows(self, datapath):
+        """Default of TRANSLATE_TABLE outside pipeline mode: on to NEXT_TABLE."""
+        yield PipelineFlow(TRANSLATE_TABLE, 0, datapath.ofproto_parser.OFPMatch(), [], NEXT_TABLE, 0)
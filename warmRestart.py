@@ -0,0 +1,261 @@
+"""Warm restart: persisted MAC tables and reconciliation with the switches.
+
+MacSnapshot keeps a MacTable on disk as a checkpoint of fixed-size records,
+read back through mmap, plus an append-only log of what changed since.
+save() only appends the difference to the last save and folds the log into
+a new checkpoint once it grows past max_log records. Both files carry the
+checkpoint's generation, so a log left over from a crash between writing a
+checkpoint and emptying the log is never replayed onto the newer checkpoint.
+
+Reconciler holds back a connecting switch's setup until its flow and meter
+config stats are in, so the app can skip flows the switch already has and
+modify rather than re-add existing meters.
+"""
+import mmap
+import os
+import struct
+
+from ryu.lib import hub
+
+import flowTracker
+import macTable
+
+MAGIC = b'VMAC0002'
+# follows MAGIC in the checkpoint and starts the log
+GENERATION = struct.Struct('!Q')
+# dpid, pack(vlan, mac), port, learned at
+RECORD = struct.Struct('!QQId')
+LOG_RECORD = struct.Struct('!cQQId')
+LEARN, FORGET = b'L', b'F'
+
+class MacSnapshot(object):
+
+    def __init__(self, directory, max_log=100000):
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, 'macs.ckpt')
+        self.log_path = os.path.join(directory, 'macs.log')
+        self.max_log = max_log
+        self.last = {}
+        self.log_records = 0
+        self.generation = 0
+        # the log on disk belongs to another generation, or there is none
+        self.log_stale = True
+
+    def _readCheckpoint(self):
+        entries = {}
+        if not os.path.exists(self.checkpoint_path) or not os.path.getsize(self.checkpoint_path):
+            return entries
+        with open(self.checkpoint_path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if buf[:len(MAGIC)] != MAGIC or len(buf) < len(MAGIC) + GENERATION.size:
+                    return entries
+                self.generation, = GENERATION.unpack_from(buf, len(MAGIC))
+                offset = len(MAGIC) + GENERATION.size
+                while offset + RECORD.size <= len(buf):
+                    dpid, key, port, ts = RECORD.unpack_from(buf, offset)
+                    entries[(dpid, key)] = (port, ts)
+                    offset += RECORD.size
+            finally:
+                buf.close()
+        return entries
+
+    def _replayLog(self, entries):
+        if not os.path.exists(self.log_path):
+            return 0
+        count = 0
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        if len(data) < GENERATION.size or GENERATION.unpack_from(data)[0] != self.generation:
+            return 0
+        self.log_stale = False
+        # a torn last record from a crash is ignored
+        for offset in range(GENERATION.size, len(data) - LOG_RECORD.size + 1, LOG_RECORD.size):
+            op, dpid, key, port, ts = LOG_RECORD.unpack_from(data, offset)
+            if op == LEARN:
+                entries[(dpid, key)] = (port, ts)
+            else:
+                entries.pop((dpid, key), None)
+            count += 1
+        return count
+
+    def load(self):
+        """Returns {(dpid, key): (port, ts)} as of the last save()."""
+        entries = self._readCheckpoint()
+        self.log_records = self._replayLog(entries)
+        self.last = dict(entries)
+        return entries
+
+    def restore(self, table):
+        """Loads the snapshot into a MacTable, oldest entries first."""
+        entries = self.load()
+        for (dpid, key), (port, ts) in sorted(entries.items(), key=lambda e: e[1][1]):
+            vlan, mac = macTable.unpack(key)
+            table.restore(dpid, vlan, mac, port, ts)
+        return len(entries)
+
+    @staticmethod
+    def entries(table):
+        return dict(((dpid, key), entry) for dpid, t in table.tables.items() for key, entry in t.items())
+
+    def save(self, table):
+        current = self.entries(table)
+        records = []
+        for k, entry in current.items():
+            if self.last.get(k) != entry:
+                records.append(LOG_RECORD.pack(LEARN, k[0], k[1], entry[0], entry[1]))
+        for k, entry in self.last.items():
+            if k not in current:
+                records.append(LOG_RECORD.pack(FORGET, k[0], k[1], entry[0], entry[1]))
+        self.last = current
+        if self.log_records + len(records) > self.max_log:
+            self.checkpoint(current)
+        elif records:
+            if self.log_stale:
+                self._newLog()
+            with open(self.log_path, 'ab') as f:
+                f.write(b''.join(records))
+            self.log_records += len(records)
+        return len(records)
+
+    def _newLog(self):
+        with open(self.log_path, 'wb') as f:
+            f.write(GENERATION.pack(self.generation))
+        self.log_records = 0
+        self.log_stale = False
+
+    def checkpoint(self, current):
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(GENERATION.pack(self.generation + 1))
+            f.write(b''.join(RECORD.pack(dpid, key, port, ts)
+                             for (dpid, key), (port, ts) in sorted(current.items())))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.checkpoint_path)
+        # the old log no longer matches the checkpoint, even if a crash keeps it
+        self.generation += 1
+        self._newLog()
+
+    def _save_loop(self, table, interval):
+        while True:
+            hub.sleep(interval)
+            self.save(table)
+
+    def start(self, table, interval=5):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        return hub.spawn(self._save_loop, table, interval)
+
+class Reconciler(object):
+    """Defers switch setup until the switch's own flows and meters are known.
+
+    reconcile() sends OFPFlowStatsRequest (and OFPMeterConfigStatsRequest
+    if meters) and keeps the features event; once every reply is in, or
+    after timeout seconds, on_ready(ev) replays the setup while installed()
+    and meterExists() answer from what the switch reported.
+    """
+
+    def __init__(self, on_ready, meters=True, timeout=5, logger=None):
+        self.on_ready = on_ready
+        self.meters = meters
+        self.timeout = timeout
+        self.logger = logger
+        self.pending = {}
+        self.flows = {}
+        self.meter_ids = {}
+        self.resuming = set()
+        self.skipped = 0
+
+    def reconcile(self, ev):
+        """Starts reconciling a newly connected switch, False if already done."""
+        datapath = ev.msg.datapath
+        if datapath.id in self.resuming:
+            return False
+        OF, parser = datapath.ofproto, datapath.ofproto_parser
+        waiting = set(['flows'])
+        self.flows[datapath.id], self.meter_ids[datapath.id] = {}, set()
+        datapath.send_msg(parser.OFPFlowStatsRequest(datapath, 0, OF.OFPTT_ALL, OF.OFPP_ANY, OF.OFPG_ANY,
+                                                     0, 0, parser.OFPMatch()))
+        if self.meters:
+            waiting.add('meters')
+            datapath.send_msg(parser.OFPMeterConfigStatsRequest(datapath, 0, OF.OFPM_ALL))
+        self.pending[datapath.id] = (ev, waiting)
+        hub.spawn_after(self.timeout, self._expire, datapath.id, ev)
+        return True
+
+    def flowStats(self, msg):
+        dpid = msg.datapath.id
+        if dpid not in self.pending:
+            return
+        flows = self.flows[dpid]
+        for stat in msg.body:
+            flows[flowTracker.flowKey(stat.table_id, stat.priority, stat.match)] = instructionBytes(stat.instructions)
+        if not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            self._done(dpid, 'flows')
+
+    def meterConfig(self, msg):
+        dpid = msg.datapath.id
+        if dpid not in self.pending:
+            return
+        self.meter_ids[dpid].update(stat.meter_id for stat in msg.body)
+        if not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            self._done(dpid, 'meters')
+
+    def _done(self, dpid, what):
+        ev, waiting = self.pending[dpid]
+        waiting.discard(what)
+        if not waiting:
+            self._resume(dpid)
+
+    def _expire(self, dpid, ev):
+        if self.pending.get(dpid, (None,))[0] is ev:
+            if self.logger is not None:
+                self.logger.warning("reconciliation of %s timed out, installing anyway", dpid)
+            self._resume(dpid)
+
+    def _resume(self, dpid):
+        ev, _ = self.pending.pop(dpid)
+        if self.logger is not None:
+            self.logger.info("reconciling %s: switch has %s flows, %s meters",
+                             dpid, len(self.flows[dpid]), len(self.meter_ids[dpid]))
+        self.resuming.add(dpid)
+        try:
+            self.on_ready(ev)
+        finally:
+            self.flows.pop(dpid, None)
+            self.meter_ids.pop(dpid, None)
+
+    def installed(self, datapath, table_id, priority, match, instructions):
+        """True if the switch already has this exact flow.
+
+        A flow that differs is about to replace the switch's entry, which is
+        recorded so a later add of the switch's version is not skipped.
+        """
+        flows = self.flows.get(datapath.id)
+        if not flows:
+            return False
+        key, wanted = flowTracker.flowKey(table_id, priority, match), instructionBytes(instructions)
+        if flows.get(key) != wanted:
+            flows[key] = wanted
+            return False
+        self.skipped += 1
+        return True
+
+    def meterExists(self, dpid, meter_id):
+        return meter_id in self.meter_ids.get(dpid, ())
+
+    def forget(self, dpid):
+        self.pending.pop(dpid, None)
+        self.flows.pop(dpid, None)
+        self.meter_ids.pop(dpid, None)
+        self.resuming.discard(dpid)
+
+def instructionBytes(instructions):
+    buf = bytearray()
+    for inst in instructions:
+        offset = len(buf)
+        inst.serialize(buf, offset)
+        del buf[offset + inst.len:]
+    return bytes(buf)